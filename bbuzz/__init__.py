@@ -5,13 +5,33 @@
 # Licensed under the MIT license (MIT)
 # Please see LICENSE file for more details
 
-import bbuzz.protocol
-import bbuzz.payload
-import bbuzz.mutate
-import bbuzz.common
-import bbuzz.fuzz
+import importlib
 
 
 __version__ = "0.1.0/Bridgette"
 __license__ = "MIT"
 __author__ = "Lockout"
+
+# Subpackages are loaded on first attribute access (PEP 562), so that a bare
+# "import bbuzz" does not pull in socket, hashlib, ipaddress and the mutation
+# engines for workers and analysis scripts that never touch them.
+_SUBMODULES = (
+        "protocol", "payload", "mutate", "session", "analyze", "common",
+        "fuzz", "profiler"
+        )
+
+
+def __getattr__(name):
+    """Import the requested subpackage on first use"""
+    if name in _SUBMODULES:
+        module = importlib.import_module("." + name, __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(
+            "module {0!r} has no attribute {1!r}".format(__name__, name)
+            )
+
+
+def __dir__():
+    """List module attributes including not yet loaded subpackages"""
+    return sorted(set(globals()) | set(_SUBMODULES))
@@ -0,0 +1,177 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+"""Bbuzz command line interface.
+
+    python3 -m bbuzz run [--profile [--profile-window SECONDS]] SCRIPT
+                         [ARGUMENTS]
+    python3 -m bbuzz analyze DATAFILE [--detail LEVEL] [--export FILE]
+                             [--window BITS]
+                             [--profile [--profile-window SECONDS]]
+    python3 -m bbuzz plan SPEC [--rate RATE] [--timeout SECONDS]
+                          [--budget SECONDS]
+
+SPEC is either a JSON file of [data, options] field pairs or a
+MODULE:ATTRIBUTE reference to a Payload, or to a function returning one,
+e.g. benchmark.loopback:ipv6_payload. Campaign scripts are never run.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import runpy
+import sys
+
+import bbuzz
+
+
+def add_profile_options(parser):
+    """Add the profiling options to a subcommand"""
+    parser.add_argument(
+            "--profile", action="store_true",
+            help="profile the start of the run"
+            )
+    parser.add_argument(
+            "--profile-window", type=float, default=30.0, metavar="SECONDS",
+            help="seconds of the run to profile (default 30)"
+            )
+    parser.add_argument(
+            "--profiler", choices=("sample", "cprofile"), default="sample",
+            help="sampling profiler or cProfile (default: sample)"
+            )
+    parser.add_argument(
+            "--profile-output", default="bbuzz-profile", metavar="PREFIX",
+            help="path prefix of the profile files"
+            )
+
+
+def run(args):
+    """Run a fuzzing campaign script, e.g. example/example.py"""
+    sys.argv = [args.script] + args.arguments
+    # As python3 SCRIPT does, for imports of sibling modules
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    runpy.run_path(args.script, run_name="__main__")
+
+
+def analyze(args):
+    """Run payload analysis over a capture file"""
+    bbuzz.common.payload_analyze(
+            data_lists=[], datafile=args.datafile,
+            detailed_analysis=args.detail
+            )
+    if args.export:
+        capture = bbuzz.analyze.Capture(datafile=args.datafile)
+        maps = bbuzz.analyze.entropy_maps(capture, window=args.window)
+        bbuzz.analyze.export(maps, args.export)
+        print("[+] Entropy maps written to {0}".format(args.export))
+
+
+def positive(value):
+    """argparse type of strictly positive seconds"""
+    seconds = float(value)
+    if seconds <= 0:
+        raise argparse.ArgumentTypeError("must be positive")
+    return seconds
+
+
+def load_payload(spec):
+    """Return the Payload of a JSON field list or a MODULE:ATTRIBUTE
+    reference"""
+    if not spec.endswith(".json") and ":" in spec:
+        module, attribute = spec.split(":", 1)
+        payload = getattr(importlib.import_module(module), attribute)
+        if callable(payload):
+            payload = payload()
+        if not isinstance(payload, bbuzz.payload.Payload):
+            bbuzz.common.error_handler(
+                    "{0} is not a Payload".format(spec)
+                    )
+            return None
+        return payload
+    payload = bbuzz.payload.Payload()
+    with open(spec) as spec_file:
+        try:
+            fields = json.load(spec_file)
+        except ValueError:
+            bbuzz.common.error_handler(
+                    "{0} is not a JSON field list".format(spec)
+                    )
+            return None
+    for data, options in fields:
+        payload.add(data, options)
+    return payload
+
+
+def plan(args):
+    """Estimate case counts and duration of a campaign before running it"""
+    payload = load_payload(args.spec)
+    if payload is None:
+        return
+    bbuzz.fuzz.planner.report(bbuzz.fuzz.plan(
+            payload, rate=args.rate, timeout=args.timeout,
+            budget=args.budget
+            ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bbuzz")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help=run.__doc__)
+    run_parser.add_argument("script")
+    run_parser.add_argument("arguments", nargs=argparse.REMAINDER)
+    add_profile_options(run_parser)
+    run_parser.set_defaults(handler=run)
+
+    analyze_parser = commands.add_parser("analyze", help=analyze.__doc__)
+    analyze_parser.add_argument("datafile")
+    analyze_parser.add_argument("--detail", type=int, default=2)
+    analyze_parser.add_argument(
+            "--export", metavar="FILE",
+            help="write bit, window and group entropy maps (.npz)"
+            )
+    analyze_parser.add_argument(
+            "--window", type=int, default=8, metavar="BITS",
+            help="sliding entropy window width (default 8)"
+            )
+    add_profile_options(analyze_parser)
+    analyze_parser.set_defaults(handler=analyze)
+
+    plan_parser = commands.add_parser("plan", help=plan.__doc__)
+    plan_parser.add_argument("spec")
+    plan_parser.add_argument(
+            "--rate", type=positive, metavar="RATE",
+            help="cases per second (default: measured generation rate)"
+            )
+    plan_parser.add_argument(
+            "--timeout", type=float, default=0.0, metavar="SECONDS",
+            help="delay between test cases"
+            )
+    plan_parser.add_argument(
+            "--budget", type=positive, metavar="SECONDS",
+            help="suggest reductions to fit this time budget"
+            )
+    plan_parser.set_defaults(handler=plan, profile=False)
+
+    args = parser.parse_args(argv)
+    if not args.profile:
+        args.handler(args)
+        return 0
+    with bbuzz.profiler.Profiler(
+            window=args.profile_window, mode=args.profiler,
+            output=args.profile_output):
+        try:
+            args.handler(args)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
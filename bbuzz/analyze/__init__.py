@@ -0,0 +1,10 @@
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+from .capture import Capture
+from .infer import infer_fields, suggest_payload, report
+from .entropy import group_entropy, window_entropy, entropy_maps, export
@@ -0,0 +1,155 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+import bbuzz.common
+
+import numpy
+
+
+CHUNK_ROWS = 4096
+
+
+class Capture():
+    """Packed bit matrix of captured payloads"""
+    def __init__(self, data_lists=None, datafile="", chunk_rows=CHUNK_ROWS):
+        """
+        Load a set of captured payloads into a packed NumPy matrix for bulk
+        analysis. Each row holds one payload, eight bits per byte, padded
+        with zeroes up to the longest payload.
+
+        data_lists:     List of payloads, either binary strings as accepted
+                        by bbuzz.common.payload_analyze or bytes values.
+        datafile:       File with one binary string payload per line.
+        chunk_rows:     Number of rows unpacked to bits at a time. Bounds
+                        memory use for large capture sets.
+        """
+        samples = list(data_lists) if data_lists else []
+        if datafile:
+            with open(datafile, 'r') as bindata:
+                for data in bindata:
+                    samples.append(data.strip())
+        self.chunk_rows = chunk_rows
+        self.count = len(samples)
+        if not samples:
+            bbuzz.common.error_handler("No data presented for analysis!")
+            self.lengths = numpy.zeros(0, dtype=numpy.int64)
+            self.matrix = numpy.zeros((0, 0), dtype=numpy.uint8)
+        elif isinstance(samples[0], str):
+            self.pack_strings(samples)
+        else:
+            self.pack_bytes(samples)
+        self.width = int(self.lengths.max()) if self.count else 0
+        self.common = int(self.lengths.min()) if self.count else 0
+
+    def pack_strings(self, samples):
+        """Pack binary string payloads"""
+        self.lengths = numpy.array([len(s) for s in samples], dtype=numpy.int64)
+        width = int(self.lengths.max())
+        packed = []
+        for row in range(0, self.count, self.chunk_rows):
+            chunk = samples[row:row + self.chunk_rows]
+            raw = ''.join(s.ljust(width, '0') for s in chunk).encode()
+            bits = numpy.frombuffer(raw, dtype=numpy.uint8).reshape(
+                    len(chunk), width
+                    ) - ord('0')
+            packed.append(numpy.packbits(bits, axis=1))
+        self.matrix = numpy.concatenate(packed)
+
+    def pack_bytes(self, samples):
+        """Pack bytes payloads"""
+        self.lengths = numpy.array(
+                [len(s) * bbuzz.common.BYTE for s in samples],
+                dtype=numpy.int64
+                )
+        width = int(self.lengths.max()) // bbuzz.common.BYTE
+        raw = b''.join(bytes(s).ljust(width, b'\0') for s in samples)
+        self.matrix = numpy.frombuffer(raw, dtype=numpy.uint8).reshape(
+                self.count, width
+                )
+
+    def chunks(self, start=0, stop=None):
+        """Yield (first_row, bits) for the bit columns start:stop, unpacked
+        chunk_rows samples at a time"""
+        if stop is None:
+            stop = self.width
+        first = start // bbuzz.common.BYTE
+        last = -(-stop // bbuzz.common.BYTE)
+        skip = start - first * bbuzz.common.BYTE
+        for row in range(0, self.count, self.chunk_rows):
+            packed = self.matrix[row:row + self.chunk_rows, first:last]
+            bits = numpy.unpackbits(packed, axis=1)
+            yield row, bits[:, skip:skip + stop - start]
+
+    def valid(self, row, rows, start=0, stop=None):
+        """Boolean matrix of bit positions present in each sample"""
+        if stop is None:
+            stop = self.width
+        positions = numpy.arange(start, stop)
+        return positions < self.lengths[row:row + rows, None]
+
+    def bit_counts(self, start=0, stop=None):
+        """Count set bits and present samples per bit position"""
+        if stop is None:
+            stop = self.width
+        ones = numpy.zeros(stop - start, dtype=numpy.int64)
+        totals = numpy.zeros(stop - start, dtype=numpy.int64)
+        for row, bits in self.chunks(start, stop):
+            present = self.valid(row, len(bits), start, stop)
+            ones += (bits & present).sum(axis=0, dtype=numpy.int64)
+            totals += present.sum(axis=0)
+        return ones, totals
+
+    def bit_probability(self, start=0, stop=None):
+        """Probability of each bit position being set"""
+        ones, totals = self.bit_counts(start, stop)
+        return ones / numpy.maximum(totals, 1)
+
+    def bit_entropy(self, start=0, stop=None):
+        """Shannon entropy of each bit position across all samples"""
+        return binary_entropy(self.bit_probability(start, stop))
+
+    def mask(self):
+        """Return the payload mask in the bbuzz.common.payload_analyze
+        notation: constant bits as 0 or 1 and variable bits as *"""
+        probability = self.bit_probability()
+        symbols = numpy.full(self.width, ord('*'), dtype=numpy.uint8)
+        symbols[probability == 0] = ord('0')
+        symbols[probability == 1] = ord('1')
+        return symbols.tobytes().decode()
+
+    def sample(self, number):
+        """Return a captured payload as a binary string"""
+        bits = numpy.unpackbits(self.matrix[number])[:self.lengths[number]]
+        return (bits + ord('0')).tobytes().decode()
+
+    def field_values(self, fields):
+        """Return a (samples, fields) matrix of unsigned integer field
+        values. Fields are (offset, length) tuples within the common
+        payload length. Values of fields wider than 53 bits are not exact."""
+        values = numpy.zeros((self.count, len(fields)))
+        weights = [
+                2.0 ** numpy.arange(length - 1, -1, -1)
+                for _, length in fields
+                ]
+        for row, bits in self.chunks(0, self.common):
+            for number, (offset, length) in enumerate(fields):
+                values[row:row + len(bits), number] = bits[
+                        :, offset:offset + length
+                        ] @ weights[number]
+        return values
+
+
+def binary_entropy(probability):
+    """Shannon entropy of bits set with the given probability"""
+    probability = numpy.asarray(probability, dtype=numpy.float64)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        ent = -(
+                probability * numpy.log2(probability) +
+                (1 - probability) * numpy.log2(1 - probability)
+                )
+    return numpy.nan_to_num(ent)
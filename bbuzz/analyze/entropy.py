@@ -0,0 +1,136 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+import bbuzz.common
+from bbuzz.analyze.infer import MAX_NUMERIC
+
+import numpy
+
+
+# Widest sliding window, its histograms take positions * 2**window counters
+MAX_WINDOW = 12
+# Window values computed at once, bounds the working memory
+BLOCK = 1 << 22
+
+
+def distribution_entropy(counts):
+    """Shannon entropy in bits of each row of value counts"""
+    counts = numpy.atleast_2d(counts).astype(numpy.float64)
+    totals = counts.sum(axis=1, keepdims=True)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        probability = counts / totals
+        ent = -(probability * numpy.log2(probability))
+    return numpy.nan_to_num(ent).sum(axis=1)
+
+
+def capture_groups(capture):
+    """Bit groups of the capture mask as (offset, length, mutability),
+    split the way bbuzz.common.group_fields does. There are none if any
+    sample is empty."""
+    if not capture.common:
+        return []
+    mask = capture.mask()[:capture.common]
+    groups = []
+    offset = 0
+    for bit_group, mutability in bbuzz.common.group_fields(
+            capture.sample(0)[:capture.common], mask):
+        groups.append((offset, len(bit_group), mutability))
+        offset += len(bit_group)
+    return groups
+
+
+def group_entropy(capture, groups=None):
+    """Entropy of the value distribution of every bit group across all
+    samples. Groups are (offset, length, ...) tuples within the common
+    payload length, by default the bit groups of the capture mask.
+    Returns an array of entropies in bits."""
+    if groups is None:
+        groups = capture_groups(capture)
+    words = []
+    columns = []
+    for group in groups:
+        offset, length = group[0], group[1]
+        first = len(words)
+        for start in range(offset, offset + length, MAX_NUMERIC):
+            words.append((start, min(MAX_NUMERIC, offset + length - start)))
+        columns.append((first, len(words)))
+    values = capture.field_values(words)
+    ent = numpy.zeros(len(groups))
+    for number, (first, last) in enumerate(columns):
+        if last - first == 1:
+            _, counts = numpy.unique(values[:, first], return_counts=True)
+        else:
+            _, counts = numpy.unique(
+                    values[:, first:last], axis=0, return_counts=True
+                    )
+        ent[number] = distribution_entropy(counts)[0]
+    return ent
+
+
+def window_entropy(capture, window=bbuzz.common.BYTE, step=1):
+    """Sliding window entropy map: the entropy of the value distribution
+    of window adjacent bits, for every step-th bit position. Windows
+    extending past the end of a sample are not counted for it.
+    Returns (positions, entropies).
+
+    Window values are cut from 24-bit words of the packed payload bytes,
+    one pass per bit offset within a byte. The run time is linear in
+    samples * positions, about 7 s for 10^5 samples of 600 bytes."""
+    if window > MAX_WINDOW:
+        bbuzz.common.error_handler(
+                "Window limited to {0} bits".format(MAX_WINDOW)
+                )
+        window = MAX_WINDOW
+    byte = bbuzz.common.BYTE
+    positions = numpy.arange(0, max(capture.width - window + 1, 0), step)
+    symbols = 1 << window
+    counts = numpy.zeros(len(positions) * symbols, dtype=numpy.int64)
+    offsets = [
+            numpy.flatnonzero(positions % byte == offset)
+            for offset in range(byte)
+            ]
+    width = capture.matrix.shape[1]
+    rows = max(BLOCK // max(width, 1), 1)
+    for row in range(0, capture.count, rows):
+        packed = capture.matrix[row:row + rows].astype(numpy.int32)
+        packed = numpy.pad(packed, ((0, 0), (0, 2)))
+        words = (packed[:, :-2] << 16) | (packed[:, 1:-1] << 8) | \
+            packed[:, 2:]
+        lengths = capture.lengths[row:row + rows, None]
+        for offset, columns in enumerate(offsets):
+            if not len(columns):
+                continue
+            shift = 3 * byte - offset - window
+            values = (words[:, positions[columns] // byte] >> shift) & \
+                (symbols - 1)
+            index = values + columns * symbols
+            if lengths.min() < capture.width:
+                index = index[positions[columns] + window <= lengths]
+            counts += numpy.bincount(index.ravel(), minlength=len(counts))
+    return positions, distribution_entropy(counts.reshape(-1, symbols))
+
+
+def entropy_maps(capture, window=bbuzz.common.BYTE, step=1):
+    """Compute all entropy maps of a capture as a dictionary of arrays.
+    Linear in samples * payload length, about 11 s for 10^5 samples of
+    600 bytes, mostly the sliding window map."""
+    groups = capture_groups(capture)
+    positions, windows = window_entropy(capture, window, step)
+    return {
+            "bit_entropy": capture.bit_entropy(),
+            "window_positions": positions,
+            "window_entropy": windows,
+            "group_offsets": numpy.array([g[0] for g in groups]),
+            "group_lengths": numpy.array([g[1] for g in groups]),
+            "group_entropy": group_entropy(capture, groups)
+            }
+
+
+def export(maps, path):
+    """Save entropy maps for plotting, loadable with numpy.load"""
+    numpy.savez_compressed(path, **maps)
@@ -0,0 +1,280 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+import bbuzz.common
+import bbuzz.payload
+
+import numpy
+
+
+# Widest field whose value is exactly representable for correlation
+MAX_NUMERIC = 53
+
+
+def boundaries(capture, align=bbuzz.common.BYTE, drop=0.5):
+    """Find candidate field boundaries in the common payload length.
+
+    Boundaries are placed at every constant/variable transition of the
+    payload mask, as bbuzz.common.group_fields does, and additionally inside
+    variable runs at every align-ed bit position where the bit entropy falls
+    by more than drop. Integer fields carry their least significant, most
+    variable bits last, so such a fall marks the start of the next field."""
+    ent = capture.bit_entropy(0, capture.common)
+    variable = ent > 0
+    cuts = {0, capture.common}
+    for position in range(1, capture.common):
+        if variable[position] != variable[position - 1]:
+            cuts.add(position)
+        elif variable[position] and position % align == 0:
+            if ent[position - 1] - ent[position] > drop:
+                cuts.add(position)
+    return sorted(cuts), ent
+
+
+def correlate(values, reference):
+    """Pearson correlation of each column of values with reference"""
+    values = values - values.mean(axis=0)
+    reference = reference - reference.mean()
+    norm = numpy.sqrt((values ** 2).sum(axis=0) * (reference ** 2).sum())
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        corr = values.T @ reference / norm
+    return numpy.nan_to_num(corr)
+
+
+def counter_step(values, length):
+    """Return the dominant modular increment of a field, or 0 if the field
+    does not step by a constant amount across the capture"""
+    if len(values) < 3 or length > MAX_NUMERIC:
+        return 0
+    steps = numpy.diff(values.astype(numpy.int64)) % (1 << length)
+    step, counts = numpy.unique(steps, return_counts=True)
+    best = counts.argmax()
+    if step[best] and counts[best] >= 0.9 * len(steps):
+        return int(step[best])
+    return 0
+
+
+def length_dependent(values, frame_length, threshold):
+    """Check if a field is a function of the frame length that rises or
+    falls with it, i.e. a length field"""
+    if len(numpy.unique(frame_length)) < 2:
+        return False
+    if abs(correlate(values[:, None], frame_length)[0]) < threshold:
+        return False
+    pairs = numpy.unique(numpy.stack((frame_length, values)), axis=1)
+    return pairs.shape[1] == len(numpy.unique(frame_length))
+
+
+def exact_role(values, length, frame_length, threshold):
+    """Return length or counter if the field values identify it as such"""
+    if length_dependent(values, frame_length, threshold):
+        return "length"
+    if counter_step(values, length):
+        return "counter"
+    return ""
+
+
+def peel(capture, offset, stop, align, threshold):
+    """Split length and counter fields off either end of a variable run.
+
+    Such fields may border other variable data without any entropy change,
+    so every align-ed prefix and suffix of the run up to MAX_NUMERIC bits
+    is tested, and the widest one with an exact role is cut off."""
+    frame_length = capture.lengths.astype(numpy.float64)
+    inner = [
+            position for position in range(offset + 1, stop)
+            if position % align == 0
+            ]
+    cuts = [offset] + inner + [stop]
+    units = list(zip(cuts[:-1], cuts[1:]))
+    # Only units within MAX_NUMERIC bits of either end are ever combined,
+    # the middle of long runs is never extracted
+    needed = [
+            unit for unit, (first, last) in enumerate(units)
+            if last - offset <= MAX_NUMERIC or stop - first <= MAX_NUMERIC
+            ]
+    extracted = capture.field_values(
+            [(units[unit][0], units[unit][1] - units[unit][0])
+             for unit in needed]
+            )
+    values = {unit: extracted[:, column] for column, unit in enumerate(needed)}
+
+    def window(first, last):
+        """Value of the units first:last combined"""
+        combined = numpy.zeros(capture.count)
+        for unit in range(first, last):
+            width = units[unit][1] - units[unit][0]
+            combined = combined * 2.0 ** width + values[unit]
+        return combined
+
+    candidates = []
+    for unit in range(len(units), 0, -1):
+        if stop - units[-unit][0] <= MAX_NUMERIC and unit < len(units):
+            candidates.append((len(units) - unit, len(units)))
+    for unit in range(len(units), 0, -1):
+        if units[unit - 1][1] - offset <= MAX_NUMERIC:
+            candidates.append((0, unit))
+    candidates.sort(key=lambda span: span[0] - span[1])
+
+    for first, last in candidates:
+        field_start, field_stop = units[first][0], units[last - 1][1]
+        role = exact_role(
+                window(first, last), field_stop - field_start,
+                frame_length, threshold
+                )
+        if not role:
+            continue
+        spans = [(field_start, field_stop, role)]
+        if field_start > offset:
+            spans = peel(
+                    capture, offset, field_start, align, threshold
+                    ) + spans
+        if field_stop < stop:
+            spans = spans + peel(
+                    capture, field_stop, stop, align, threshold
+                    )
+        return spans
+    return [(offset, stop, "variable")]
+
+
+def infer_fields(capture, align=bbuzz.common.BYTE, drop=0.5,
+                 threshold=0.99, enum_limit=16):
+    """Infer the field layout of a set of captured payloads.
+
+    Returns a list of dictionaries, one per field, with the keys:
+    OFFSET, LENGTH:     Field position and size in bits.
+    ENTROPY:            Mean bit entropy of the field.
+    ROLE:               constant, length, counter, sequence, enum, variable
+                        or tail.
+    DATA:               Field value of the first sample as a binary string.
+    TYPE, FUZZABLE:     Suggested bbuzz.payload.Payload options.
+    LENGTH_CORR:        Correlation of the field value with frame length.
+    SEQUENCE_CORR:      Correlation of the field value with capture order.
+    CORRELATED:         Numbers of other fields whose values correlate with
+                        this one above threshold.
+    VALUES:             Distinct values seen for an enum field.
+    """
+    if not capture.count:
+        bbuzz.common.error_handler("No data presented for field inference!")
+        return []
+
+    cuts, ent = boundaries(capture, align, drop)
+    spans = []
+    for offset, stop in zip(cuts[:-1], cuts[1:]):
+        if ent[offset:stop].any():
+            spans += peel(capture, offset, stop, align, threshold)
+        else:
+            spans.append((offset, stop, "constant"))
+
+    reference = capture.sample(0)
+    fields = []
+    for offset, stop, role in spans:
+        fields.append({
+            "OFFSET": offset,
+            "LENGTH": stop - offset,
+            "ENTROPY": float(ent[offset:stop].mean()),
+            "ROLE": role,
+            "DATA": reference[offset:stop],
+            "CORRELATED": []
+            })
+
+    numeric = [
+            number for number, field in enumerate(fields)
+            if field["ROLE"] != "constant" and
+            field["LENGTH"] <= MAX_NUMERIC
+            ]
+    values = capture.field_values(
+            [(fields[n]["OFFSET"], fields[n]["LENGTH"]) for n in numeric]
+            )
+    length_corr = correlate(values, capture.lengths.astype(numpy.float64))
+    sequence_corr = correlate(
+            values, numpy.arange(capture.count, dtype=numpy.float64)
+            )
+
+    for column, number in enumerate(numeric):
+        field = fields[number]
+        field["LENGTH_CORR"] = float(length_corr[column])
+        field["SEQUENCE_CORR"] = float(sequence_corr[column])
+        if field["ROLE"] != "variable":
+            continue
+        if abs(sequence_corr[column]) >= threshold:
+            field["ROLE"] = "sequence"
+            continue
+        distinct = numpy.unique(values[:, column])
+        if len(distinct) <= enum_limit:
+            field["ROLE"] = "enum"
+            field["VALUES"] = [
+                    bbuzz.common.dec2bin(value, field["LENGTH"])
+                    for value in distinct
+                    ]
+
+    if len(numeric) > 1:
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            matrix = numpy.nan_to_num(numpy.corrcoef(values, rowvar=False))
+        for column, number in enumerate(numeric):
+            fields[number]["CORRELATED"] = [
+                    numeric[other] for other in range(len(numeric))
+                    if other != column and
+                    abs(matrix[column, other]) >= threshold
+                    ]
+
+    if len(reference) > capture.common:
+        # Payloads differ in length: the remainder of the reference payload
+        # is kept as a single variable length tail
+        fields.append({
+            "OFFSET": capture.common,
+            "LENGTH": len(reference) - capture.common,
+            "ENTROPY": float(capture.bit_entropy(
+                capture.common, capture.width).mean()),
+            "ROLE": "tail",
+            "DATA": reference[capture.common:],
+            "CORRELATED": []
+            })
+
+    for field in fields:
+        if field["ROLE"] == "constant":
+            field["TYPE"] = "static"
+            field["FUZZABLE"] = False
+        elif field["ROLE"] in {"length", "counter", "sequence"}:
+            field["TYPE"] = "numeric"
+            field["FUZZABLE"] = True
+        else:
+            field["TYPE"] = "binary"
+            field["FUZZABLE"] = True
+    return fields
+
+
+def suggest_payload(capture, fields=None, **options):
+    """Build a bbuzz.payload.Payload from inferred fields"""
+    if fields is None:
+        fields = infer_fields(capture, **options)
+    load = bbuzz.payload.Payload()
+    for field in fields:
+        load.add(field["DATA"], {
+            "FORMAT": "bin",
+            "TYPE": field["TYPE"],
+            "LENGTH": field["LENGTH"],
+            "FUZZABLE": field["FUZZABLE"]
+            })
+    return load
+
+
+def report(fields):
+    """Print inferred fields"""
+    print("[+] Inferred fields:")
+    for number, field in enumerate(fields):
+        print("\t[-] Field {0}: offset {1}, length {2}, {3} "
+              "(entropy {4:.3f}, type {5})".format(
+                  number, field["OFFSET"], field["LENGTH"], field["ROLE"],
+                  field["ENTROPY"], field["TYPE"]
+                  ))
+        if field.get("VALUES"):
+            print("\t\tvalues: {0}".format(', '.join(field["VALUES"])))
+        if field["CORRELATED"]:
+            print("\t\tcorrelated with fields: {0}".format(
+                field["CORRELATED"]))
@@ -6,7 +6,6 @@
 # Licensed under the MIT license (MIT)
 # Please see LICENSE file for more details
 
-import ipaddress
 from binascii import unhexlify
 from math import log
 from collections import Counter
@@ -28,6 +27,7 @@ def error_handler(message):
 
 def ipversion(ip_address):
     """Identify IP version"""
+    import ipaddress
     return ipaddress.ip_address(ip_address).version
 
 
@@ -48,10 +48,9 @@ def ip2hex(ip_address):
             hexip = hexip + unhexlify(hexoct)
         return hexip
     if ip_version == 6:
-        zeroes = 16 - len(mac2hex(ip_address))
-        full_ip_address = ip_address.replace(
-            '::', '00' * zeroes).replace(':', '')
-        return unhexlify(full_ip_address)
+        # Groups may omit leading zeroes, let ipaddress expand them
+        import ipaddress
+        return ipaddress.IPv6Address(ip_address).packed
 
 
 def ip2bin(ip_address):
@@ -85,6 +84,19 @@ def bin2hex(binvalue):
     return hexvalue
 
 
+def checksum(data):
+    """Calculate the Internet checksum (RFC 1071) of bytes"""
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(
+            int.from_bytes(data[i:i + 2], 'big')
+            for i in range(0, len(data), 2)
+            )
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
 def oct2bin(octvalue, init_length):
     """Convert octal value to binary"""
     value = str(bin(int(octvalue, 8))[2:])
@@ -159,22 +171,10 @@ def payload_analyze(data_lists=[], datafile="", detailed_analysis=2):
     if data_lists:
         # Get the bit mask of payload
         reflist = data_lists[0]
-        payload_mask = ['#'] * len(reflist)
-        fail = False
-        for position in range(0, len(reflist)):
-            symbol = reflist[position]
-            for data in data_lists[1::]:
-                data_symbol = data[position]
-                if data_symbol != symbol and not fail:
-                    fail = True
-                    break
-            if not fail:
-                payload_mask[position] = symbol
-            if fail:
-                payload_mask[position] = "*"
-                fail = False
-        str_payload_mask = ''.join(payload_mask)
+        str_payload_mask = payload_mask(data_lists)
         print("[+] Payload mask:\n{0}".format(str_payload_mask))
+        if not str_payload_mask:
+            detailed_analysis = 0
 
         if detailed_analysis >= 1:
             # Extract bit-groups
@@ -183,15 +183,47 @@ def payload_analyze(data_lists=[], datafile="", detailed_analysis=2):
             print("\t[-] Bit group: {}".format(field_list))
 
         if detailed_analysis >= 2:
-            # Calculate entropy for bit-groups
+            # Calculate entropy of every bit-group across all payloads
             print("[+] Bit group entropy:")
-            payload_entropy = entropy(reflist)
-            print("\t[-] Payload entropy: {}".format(payload_entropy))
+            offset = 0
+            for bit_group, mutability in field_list:
+                group_values = [
+                        data[offset:offset + len(bit_group)]
+                        for data in data_lists
+                        ]
+                print("\t[-] Bit group {0}-{1} ({2}): {3}".format(
+                    offset, offset + len(bit_group) - 1, mutability,
+                    entropy(group_values)
+                    ))
+                offset += len(bit_group)
 
     if not data_lists and not datafile:
         error_handler("No data presented for pattern analysis!")
 
 
+def payload_mask(data_lists):
+    """Return the bit mask of a set of binary string payloads: bits equal in
+    all payloads keep their value, differing bits are marked with *.
+    The mask covers the length of the first payload, bits missing in
+    shorter payloads are differing."""
+    reflist = data_lists[0]
+    payload_mask = ['#'] * len(reflist)
+    fail = False
+    for position in range(0, len(reflist)):
+        symbol = reflist[position]
+        for data in data_lists[1::]:
+            data_symbol = data[position] if position < len(data) else None
+            if data_symbol != symbol and not fail:
+                fail = True
+                break
+        if not fail:
+            payload_mask[position] = symbol
+        if fail:
+            payload_mask[position] = "*"
+            fail = False
+    return ''.join(payload_mask)
+
+
 def group_fields(payload, payload_mask, silent=True):
     """Retrieves payload and bit-mask group intersections"""
     bit_group = ""
@@ -218,7 +250,7 @@ def group_fields(payload, payload_mask, silent=True):
         prevchar = char
     if bit_group:
         instance = (
-            bit_group, 'mutable' if payload[-1] == '*' else 'immutable'
+            bit_group, 'mutable' if payload_mask[-1] == '*' else 'immutable'
             )
         if not silent:
             print(instance)
@@ -231,7 +263,7 @@ def entropy(data):
     Courtesy of rosettacode.org"""
     counter = Counter(data)
     length = float(len(data))
-    ent = -sum(
+    ent = 0.0 - sum(
         count / length * log(count / length, 2)
         for count in counter.values()
         )
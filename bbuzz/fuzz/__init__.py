@@ -6,3 +6,6 @@
 # Please see LICENSE file for more details
 
 from .fuzz import Fuzz
+from .store import ResponseStore
+from .coordinator import Coordinator, Worker
+from .planner import plan
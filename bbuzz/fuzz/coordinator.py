@@ -0,0 +1,310 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+import bbuzz.common
+
+import json
+import socket
+import socketserver
+import threading
+from collections import deque
+from time import monotonic, perf_counter, sleep
+
+
+class Server(socketserver.ThreadingTCPServer):
+    """Coordinator TCP server, restartable on the same port"""
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class Coordinator():
+    """Distribute the indexed mutation space of a campaign to workers"""
+    def __init__(self, mutant, address=("127.0.0.1", 0), lease_size=1000,
+                 lease_timeout=60.0):
+        """
+        Own the indexed mutation space (Mutate.indexed_count()) of a Mutate
+        instance and lease ranges of case indexes to Worker nodes over TCP.
+        Leases neither completed nor renewed within lease_timeout seconds
+        are reclaimed and handed out again. Counters and crash reports sent by the workers
+        are aggregated.
+
+        The protocol is one JSON object per line, each request answered
+        with one response line:
+        {"op": "hello", "worker": NAME}  -> {"total": COUNT}
+        {"op": "lease", "worker": NAME}  -> {"lease": ID, "start": INDEX,
+                                             "stop": INDEX,
+                                             "timeout": SECONDS}
+                                            or {"wait": SECONDS}
+                                            or {"done": true}
+        {"op": "renew", "lease": ID}    -> {"ok": BOOL}
+        {"op": "complete", "lease": ID, "counters": {NAME: COUNT},
+         "crashes": [{"case": INDEX, ...}]}  -> {"ok": BOOL}
+        {"op": "stats"}                  -> aggregated statistics
+        """
+        self.total = mutant.indexed_count()
+        self.lease_size = lease_size
+        self.lease_timeout = lease_timeout
+        self.lock = threading.Lock()
+        self.next_index = 0
+        self.next_lease = 0
+        self.leases = {}
+        self.reclaimed = deque()
+        self.completed = 0
+        self.reclaims = 0
+        self.counters = {}
+        self.crashes = []
+        self.workers = set()
+        self.finished = threading.Event()
+        coordinator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                        response = coordinator.dispatch(request)
+                    except (ValueError, KeyError, TypeError) as error:
+                        response = {"error": str(error)}
+                    self.wfile.write(json.dumps(response).encode() + b"\n")
+
+        self.server = Server(address, Handler)
+        self.address = self.server.server_address
+
+    def start(self):
+        """Serve workers in a background thread"""
+        self.thread = threading.Thread(
+                target=self.server.serve_forever, daemon=True
+                )
+        self.thread.start()
+        return self.address
+
+    def wait(self, timeout=None):
+        """Block until the whole space is completed"""
+        return self.finished.wait(timeout)
+
+    def stop(self):
+        """Stop serving workers"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def dispatch(self, request):
+        """Answer a single worker request"""
+        operation = request["op"]
+        with self.lock:
+            if operation == "hello":
+                self.workers.add(request["worker"])
+                return {"total": self.total}
+            if operation == "lease":
+                return self.lease(request["worker"])
+            if operation == "renew":
+                return self.renew(request)
+            if operation == "complete":
+                return self.complete(request)
+            if operation == "stats":
+                return self.stats()
+        return {"error": "unknown operation {0}".format(operation)}
+
+    def reclaim(self):
+        """Return expired leases to the pool"""
+        now = monotonic()
+        for lease_id, lease in list(self.leases.items()):
+            if lease["deadline"] < now:
+                del self.leases[lease_id]
+                self.reclaimed.append((lease["start"], lease["stop"]))
+                self.reclaims += 1
+
+    def lease(self, worker):
+        """Lease the next range of case indexes"""
+        self.reclaim()
+        if self.reclaimed:
+            start, stop = self.reclaimed.popleft()
+        elif self.next_index < self.total:
+            start = self.next_index
+            stop = min(start + self.lease_size, self.total)
+            self.next_index = stop
+        elif self.leases:
+            # Everything is leased, a lease may still expire
+            return {"wait": min(1.0, self.lease_timeout)}
+        else:
+            return {"done": True}
+        lease_id = self.next_lease
+        self.next_lease += 1
+        self.leases[lease_id] = {
+                "start": start,
+                "stop": stop,
+                "worker": worker,
+                "deadline": monotonic() + self.lease_timeout
+                }
+        return {
+                "lease": lease_id,
+                "start": start,
+                "stop": stop,
+                "timeout": self.lease_timeout
+                }
+
+    def renew(self, request):
+        """Extend the deadline of a lease still being worked on"""
+        lease = self.leases.get(request["lease"])
+        if lease is None:
+            # Expired and reclaimed already, the worker should give it up
+            return {"ok": False}
+        lease["deadline"] = monotonic() + self.lease_timeout
+        return {"ok": True}
+
+    def complete(self, request):
+        """Record a completed lease with its counters and crashes"""
+        lease = self.leases.pop(request["lease"], None)
+        if lease is None:
+            # Expired and reclaimed already: the range runs again and is
+            # counted then
+            return {"ok": False}
+        for name, count in request.get("counters", {}).items():
+            self.counters[name] = self.counters.get(name, 0) + count
+        self.crashes += request.get("crashes", [])
+        self.completed += lease["stop"] - lease["start"]
+        if self.completed >= self.total:
+            self.finished.set()
+        return {"ok": True}
+
+    def stats(self):
+        """Return the aggregated campaign statistics"""
+        return {
+                "TOTAL": self.total,
+                "COMPLETED": self.completed,
+                "LEASED": len(self.leases),
+                "RECLAIMS": self.reclaims,
+                "WORKERS": len(self.workers),
+                "COUNTERS": dict(self.counters),
+                "CRASHES": list(self.crashes)
+                }
+
+    def report(self):
+        """Print the aggregated campaign statistics"""
+        with self.lock:
+            stats = self.stats()
+        print("[+] Campaign: {0} of {1} cases completed by {2} workers, "
+              "{3} leases reclaimed".format(
+                  stats["COMPLETED"], stats["TOTAL"], stats["WORKERS"],
+                  stats["RECLAIMS"]))
+        for name, count in sorted(stats["COUNTERS"].items()):
+            print("\t[-] {0}: {1}".format(name, count))
+        for crash in stats["CRASHES"][:20]:
+            print("\t[-] Crash at case {0}: {1}".format(
+                crash["case"], crash.get("info", "")))
+
+
+class Worker():
+    """Fuzz case index leases handed out by a Coordinator"""
+    def __init__(self, address, mutant, protocol, name=None, timeout=0.0,
+                 oracle=None):
+        """
+        The worker builds test cases from its own Mutate instance, which
+        must be created from the same payload and options as the one of
+        the coordinator.
+
+        timeout:    Seconds to wait for a response after every case.
+        oracle:     Optional function oracle(case, payload, response),
+                    returning crash details (a JSON serializable value) or
+                    None. Responses are only collected if it is given.
+        """
+        self.address = tuple(address)
+        self.mutant = mutant
+        self.protocol = protocol
+        self.name = name or "{0}:{1}".format(socket.gethostname(), id(self))
+        self.timeout = timeout
+        self.oracle = oracle
+
+    def request(self, message):
+        """Send a request to the coordinator and return its response.
+        Raises ConnectionError if the coordinator went away and
+        ValueError if it rejected the request."""
+        self.stream.write(json.dumps(message).encode() + b"\n")
+        self.stream.flush()
+        line = self.stream.readline()
+        if not line:
+            raise ConnectionError("coordinator closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response
+
+    def run(self):
+        """Work until the coordinator has no cases left.
+        Returns False if the coordinator fails or goes away."""
+        try:
+            connection = socket.create_connection(self.address)
+        except OSError as error:
+            return bbuzz.common.error_handler(
+                    "Cannot reach coordinator: {0}".format(error)
+                    )
+        self.stream = connection.makefile('rwb')
+        try:
+            total = self.request({"op": "hello", "worker": self.name})
+            if total["total"] != self.mutant.indexed_count():
+                return bbuzz.common.error_handler(
+                        "Worker mutation space does not match coordinator"
+                        )
+            while True:
+                lease = self.request({"op": "lease", "worker": self.name})
+                if lease.get("done"):
+                    break
+                if "wait" in lease:
+                    sleep(lease["wait"])
+                    continue
+                counters, crashes = self.fuzz(lease)
+                if counters is None:
+                    continue
+                self.request({
+                    "op": "complete",
+                    "lease": lease["lease"],
+                    "counters": counters,
+                    "crashes": crashes
+                    })
+        except (OSError, ValueError, KeyError) as error:
+            # OSError covers ConnectionError, ValueError JSON errors
+            return bbuzz.common.error_handler(
+                    "Coordinator failed: {0}".format(error)
+                    )
+        finally:
+            self.stream.close()
+            connection.close()
+        return True
+
+    def fuzz(self, lease):
+        """Send the cases of a lease, renewing it every half lease timeout.
+        Returns (None, None) if the lease was lost to another worker."""
+        start, stop = lease["start"], lease["stop"]
+        renew_every = lease["timeout"] / 2
+        renew_at = monotonic() + renew_every
+        crashes = []
+        responses = 0
+        began = perf_counter()
+        for case in range(start, stop):
+            if monotonic() >= renew_at:
+                renewed = self.request(
+                        {"op": "renew", "lease": lease["lease"]}
+                        )
+                if not renewed["ok"]:
+                    return None, None
+                renew_at = monotonic() + renew_every
+            payload = self.mutant.indexed_case(case)
+            self.protocol.send(payload)
+            if self.oracle is not None:
+                response = self.protocol.receive(self.timeout)
+                responses += bool(response)
+                info = self.oracle(case, payload, response)
+                if info is not None:
+                    crashes.append({"case": case, "info": info})
+            elif self.timeout:
+                sleep(self.timeout)
+        return {
+                "sent": stop - start,
+                "responses": responses,
+                "crashes": len(crashes),
+                "busy_ms": int((perf_counter() - began) * 1000)
+                }, crashes
@@ -6,17 +6,43 @@
 # Licensed under the MIT license (MIT)
 # Please see LICENSE file for more details
 
-from time import sleep
+import bbuzz.fuzz.pipeline
+
+import multiprocessing
+from time import sleep, perf_counter, perf_counter_ns
 
 
 class Fuzz():
     """Conduct and manage the fuzzing process"""
-    def __init__(self, timeout=0.1):
-        """Set fuzzing parameters"""
+    def __init__(self, timeout=0.1, store=None, baseline=16):
+        """Set fuzzing parameters.
+        If a bbuzz.fuzz.store.ResponseStore is given, target responses to
+        every test case are collected into it. A store without a response
+        mask is first calibrated on the replies to baseline sends of the
+        unmutated reference case."""
         self.timeout = timeout
+        self.store = store
+        self.baseline = baseline
+
+    def calibrate(self, mutant, protocol):
+        """Learn the response store mask from replies to the reference
+        case"""
+        reference = mutant.reference()
+        responses = []
+        for _ in range(self.baseline):
+            if isinstance(reference, list):
+                protocol.send_sequence(reference)
+            else:
+                protocol.send(reference)
+            responses.append(protocol.receive(self.timeout))
+        self.store.calibrate(responses)
 
     def fuzz(self, mutant, protocol):
         """Start the fuzzing process"""
+        case = 0
+        if self.store is not None and self.store.mask is None and \
+                self.baseline:
+            self.calibrate(mutant, protocol)
         while True:
             payload = mutant.get()
             if payload == "__END":
@@ -24,13 +50,136 @@ class Fuzz():
             elif payload == "__FIN":
                 print("FIN")
                 break
-            elif payload:
-                protocol.send(payload)
-                sleep(self.timeout)
             elif not payload:
                 break
+            else:
+                start = perf_counter()
+                if isinstance(payload, list):
+                    # Session test case: several messages over one connection
+                    protocol.send_sequence(payload)
+                else:
+                    protocol.send(payload)
+                evolve = mutant.options.get("EVOLVE")
+                if evolve or self.store is not None:
+                    # The response wait replaces the delay between cases
+                    response = protocol.receive(self.timeout)
+                    if evolve:
+                        mutant.feedback(response, perf_counter() - start)
+                    if self.store is not None:
+                        self.store.add(case, response)
+                else:
+                    sleep(self.timeout)
+                case += 1
+        if self.store is not None:
+            self.store.close()
         protocol.kill()
 
+    def pipeline(self, mutant, protocol, generators=2, slots=4096,
+                 slot_size=2048, batch=64, limit=0):
+        """Start the fuzzing process with generation and sending decoupled.
+
+        Each of the generators processes takes its share of the mutations,
+        assembles them and writes them into its own shared memory ring of
+        slots frames of up to slot_size bytes. This process drains the
+        rings and sends up to batch frames at a time, waiting timeout
+        seconds after every batch. Fuzzing stops when all generators are
+        depleted or after limit frames, if set.
+
+        Response feedback (EVOLVE) and sessions are not supported in this
+        mode. Returns the throughput statistics, which are also printed,
+        or False if a generator failed."""
+        context = multiprocessing.get_context("fork")
+        rings = []
+        workers = []
+        for shard_number in range(generators):
+            ring = bbuzz.fuzz.pipeline.Ring(slots, slot_size)
+            worker = context.Process(
+                    target=bbuzz.fuzz.pipeline.produce,
+                    args=(mutant, ring, shard_number, generators),
+                    daemon=True
+                    )
+            worker.start()
+            rings.append(ring)
+            workers.append(worker)
+
+        sent = 0
+        empty_waits = 0
+        send_ns = 0
+        start = perf_counter()
+        share = max(batch // generators, 1)
+        try:
+            while True:
+                frames = []
+                for ring in rings:
+                    frames += ring.take(share)
+                if not frames:
+                    if any(worker.exitcode for worker in workers):
+                        break
+                    if all(ring.drained() for ring in rings):
+                        break
+                    empty_waits += 1
+                    sleep(bbuzz.fuzz.pipeline.POLL)
+                    continue
+                if limit:
+                    frames = frames[:limit - sent]
+                send_start = perf_counter_ns()
+                protocol.send_batch(frames)
+                send_ns += perf_counter_ns() - send_start
+                sent += len(frames)
+                if limit and sent >= limit:
+                    break
+                if self.timeout:
+                    sleep(self.timeout)
+        finally:
+            elapsed = perf_counter() - start
+            for ring in rings:
+                ring.counters[ring.STOP] = 1
+            for worker in workers:
+                worker.join()
+            stats = self.pipeline_stats(
+                    rings, sent, send_ns, empty_waits, elapsed
+                    )
+            for ring in rings:
+                ring.close()
+            protocol.kill()
+        bbuzz.fuzz.pipeline.report(stats)
+        failed = [
+                str(number) for number, worker in enumerate(workers)
+                if worker.exitcode
+                ]
+        if failed:
+            return bbuzz.common.error_handler(
+                    "Generator {0} failed, the run is incomplete".format(
+                        ", ".join(failed))
+                    )
+        return stats
+
+    def pipeline_stats(self, rings, sent, send_ns, empty_waits, elapsed):
+        """Collect per-stage throughput counters of a pipeline run"""
+        producers = []
+        for ring in rings:
+            busy = ring.counters[ring.BUSY_NS] / 1e9
+            producers.append({
+                "FRAMES": ring.counters[ring.PRODUCED],
+                "RATE": ring.counters[ring.PRODUCED] / busy if busy else 0.0,
+                "FULL_WAITS": ring.counters[ring.FULL_WAITS]
+                })
+        full_waits = sum(producer["FULL_WAITS"] for producer in producers)
+        if full_waits > empty_waits:
+            bottleneck = "send"
+        elif empty_waits > full_waits:
+            bottleneck = "generate"
+        else:
+            bottleneck = "none"
+        return {
+                "GENERATORS": producers,
+                "SENT": sent,
+                "SEND_RATE": sent / (send_ns / 1e9) if send_ns else 0.0,
+                "EMPTY_WAITS": empty_waits,
+                "RATE": sent / elapsed if elapsed else 0.0,
+                "BOTTLENECK": bottleneck
+                }
+
     def monitor(self):
         """Monitor the fuzzing target"""
         pass
@@ -0,0 +1,129 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+import bbuzz.common
+
+import struct
+from multiprocessing import shared_memory
+from time import sleep, perf_counter_ns
+
+
+POLL = 0.0001
+SLOT_HEADER = struct.Struct("=I")
+
+
+class Ring():
+    """Single producer, single consumer frame ring in shared memory"""
+    # Header counters, each one written by a single side only
+    TAIL, PRODUCED, FULL_WAITS, BUSY_NS, DONE = range(5)
+    HEAD, STOP = 5, 6
+    HEADER_SIZE = 8 * 8
+
+    def __init__(self, slots=4096, slot_size=2048):
+        """
+        Ring buffer of slots fixed size frame slots. The producer owns the
+        tail and its counters, the consumer owns the head, so no locking is
+        needed. Producers block while the ring is full, which is counted as
+        backpressure from the sender.
+        """
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stride = SLOT_HEADER.size + slot_size
+        self.shm = shared_memory.SharedMemory(
+                create=True,
+                size=self.HEADER_SIZE + slots * self.stride
+                )
+        self.counters = self.shm.buf[:self.HEADER_SIZE].cast('Q')
+        for counter in range(len(self.counters)):
+            self.counters[counter] = 0
+
+    def put(self, frame):
+        """Write a frame, waiting for a free slot.
+        Returns False if the consumer asked to stop."""
+        if len(frame) > self.slot_size:
+            bbuzz.common.error_handler(
+                    "Frame of {0} bytes exceeds ring slot size".format(
+                        len(frame))
+                    )
+            return True
+        counters = self.counters
+        tail = counters[self.TAIL]
+        while tail - counters[self.HEAD] >= self.slots:
+            if counters[self.STOP]:
+                return False
+            counters[self.FULL_WAITS] += 1
+            sleep(POLL)
+        offset = self.HEADER_SIZE + (tail % self.slots) * self.stride
+        SLOT_HEADER.pack_into(self.shm.buf, offset, len(frame))
+        start = offset + SLOT_HEADER.size
+        self.shm.buf[start:start + len(frame)] = frame
+        counters[self.PRODUCED] += 1
+        counters[self.TAIL] = tail + 1
+        return not counters[self.STOP]
+
+    def take(self, limit):
+        """Read up to limit ready frames without waiting"""
+        counters = self.counters
+        head = counters[self.HEAD]
+        ready = min(counters[self.TAIL] - head, limit)
+        frames = []
+        for position in range(head, head + ready):
+            offset = self.HEADER_SIZE + (position % self.slots) * self.stride
+            length = SLOT_HEADER.unpack_from(self.shm.buf, offset)[0]
+            start = offset + SLOT_HEADER.size
+            frames.append(bytes(self.shm.buf[start:start + length]))
+        counters[self.HEAD] = head + ready
+        return frames
+
+    def drained(self):
+        """Check if the producer finished and all frames were taken"""
+        counters = self.counters
+        return counters[self.DONE] and counters[self.HEAD] == \
+            counters[self.TAIL]
+
+    def close(self):
+        """Release and remove the shared memory block"""
+        self.counters.release()
+        self.shm.close()
+        self.shm.unlink()
+
+
+def produce(mutant, ring, shard_number, shard_count):
+    """Generator process: fill the ring with assembled mutations"""
+    counters = ring.counters
+    try:
+        mutant.shard(shard_number, shard_count)
+        while True:
+            start = perf_counter_ns()
+            payload = mutant.get()
+            counters[ring.BUSY_NS] += perf_counter_ns() - start
+            if payload == "__END":
+                continue
+            if not payload or payload == "__FIN":
+                break
+            if not ring.put(payload):
+                break
+    finally:
+        # Also on errors, the sender waits for every ring to be done
+        counters[ring.DONE] = 1
+
+
+def report(stats):
+    """Print pipeline throughput counters"""
+    print("[+] Pipeline statistics:")
+    for number, producer in enumerate(stats["GENERATORS"]):
+        print("\t[-] Generator {0}: {1} frames, {2:.0f} frames/s busy, "
+              "{3} full waits".format(
+                  number, producer["FRAMES"], producer["RATE"],
+                  producer["FULL_WAITS"]
+                  ))
+    print("\t[-] Sender: {0} frames, {1:.0f} frames/s busy, "
+          "{2} empty waits".format(
+              stats["SENT"], stats["SEND_RATE"], stats["EMPTY_WAITS"]))
+    print("\t[-] Overall: {0:.0f} frames/s, bottleneck: {1}".format(
+        stats["RATE"], stats["BOTTLENECK"]))
@@ -0,0 +1,179 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+import bbuzz.common
+import bbuzz.mutate
+from bbuzz.mutate.mutate import combine_count
+
+from math import ceil
+from time import perf_counter
+
+
+def measure_rate(mutant, protocol=None, cases=2000):
+    """Measure test cases per second of a mutant, sent over protocol if
+    given, otherwise only generated and assembled"""
+    total = mutant.indexed_count()
+    if not total:
+        return 0.0
+    step = max(total // cases, 1)
+    indexes = range(0, min(total, cases * step), step)
+    start = perf_counter()
+    for index in indexes:
+        payload = mutant.indexed_case(index)
+        if protocol is not None:
+            protocol.send(payload)
+    elapsed = perf_counter() - start
+    return len(indexes) / elapsed if elapsed else 0.0
+
+
+def duration(cases, rate, timeout=0.0):
+    """Projected seconds to run cases at rate with a per-case delay"""
+    if not rate:
+        return float("inf")
+    return cases * (1.0 / rate + timeout)
+
+
+def fit_static(sizes, fuzzable, budget_cases):
+    """Greedily pick the fields with most mutations to mark static until
+    the product of the remaining ones fits budget_cases"""
+    sizes = list(sizes)
+    marked = []
+    order = sorted(fuzzable, key=lambda field: sizes[field], reverse=True)
+    for field_number in order:
+        if combine_count(sizes) <= budget_cases:
+            break
+        marked.append(field_number)
+        sizes[field_number] = 1
+    return marked, combine_count(sizes)
+
+
+def plan(payload, rate=None, timeout=0.0, budget=None, protocol=None):
+    """Estimate the size and duration of a campaign before starting it.
+
+    payload:    The bbuzz.payload.Payload to be fuzzed.
+    rate:       Send rate in cases per second, e.g. from an earlier run or
+                the loopback benchmark. Measured if not given: over
+                protocol if given, otherwise the generation rate, which is
+                an upper bound.
+    timeout:    Delay between test cases (Fuzz timeout).
+    budget:     Time budget in seconds for which reductions are
+                suggested, must be positive.
+
+    Returns a dictionary with per-field counts, the case counts of each
+    COMBINE mode and the deterministic stages, projected durations and
+    suggestions.
+    """
+    mutant = bbuzz.mutate.Mutate(
+            payload,
+            {"STATIC": True, "RANDOM": False, "DETERMINISTIC": True}
+            )
+    if rate is None:
+        rate = measure_rate(mutant, protocol)
+        measured = "send" if protocol is not None else "generation"
+    else:
+        measured = "given"
+
+    fields = []
+    sizes = []
+    fuzzable = []
+    for field_number in range(payload.field_count()):
+        count = len(mutant.mutations[field_number])
+        sizes.append(count)
+        if payload.bitfield_fuzzable(field_number) and count > 1:
+            fuzzable.append(field_number)
+        fields.append({
+            "FIELD": field_number,
+            "TYPE": payload.bitfield_type(field_number),
+            "LENGTH": payload.bitfield_length(field_number),
+            "FUZZABLE": payload.bitfield_fuzzable(field_number),
+            "MUTATIONS": count
+            })
+
+    modes = {
+            mode: combine_count(sizes, mode)
+            for mode in ("product", "pairwise", "single")
+            }
+    result = {
+            "FIELDS": fields,
+            "CASES": modes,
+            "DETERMINISTIC": mutant.case_count(),
+            "RATE": rate,
+            "RATE_SOURCE": measured,
+            "TIMEOUT": timeout,
+            "DURATION": {
+                mode: duration(cases, rate, timeout)
+                for mode, cases in modes.items()
+                },
+            "BUDGET": budget,
+            "SUGGESTIONS": []
+            }
+    result["DURATION"]["deterministic"] = duration(
+            result["DETERMINISTIC"], rate, timeout
+            )
+
+    if budget is None or result["DURATION"]["product"] <= budget:
+        return result
+    if budget <= 0:
+        bbuzz.common.error_handler("Planning budget must be positive")
+        return result
+    suggestions = result["SUGGESTIONS"]
+    budget_cases = int(budget / (1.0 / rate + timeout)) if rate else 0
+    marked, remaining = fit_static(sizes, fuzzable, budget_cases)
+    if remaining <= budget_cases and marked:
+        suggestions.append(
+                "Mark fields {0} static: {1} product cases".format(
+                    ", ".join(str(field) for field in marked), remaining)
+                )
+    for mode in ("pairwise", "single"):
+        if result["DURATION"][mode] <= budget:
+            suggestions.append(
+                    "Use COMBINE {0}: {1} cases".format(mode, modes[mode])
+                    )
+    if budget_cases:
+        suggestions.append(
+                "Use RANDOM only: {0} random cases".format(budget_cases)
+                )
+    if result["DURATION"]["product"] != float("inf"):
+        workers = ceil(result["DURATION"]["product"] / budget)
+        suggestions.append(
+                "Run the full product on {0} workers of this rate".format(
+                    workers)
+                )
+    return result
+
+
+def human(seconds):
+    """Format seconds for humans"""
+    if seconds == float("inf"):
+        return "unknown"
+    for unit, size in (("years", 31557600), ("days", 86400),
+                       ("hours", 3600), ("minutes", 60)):
+        if seconds >= size:
+            return "{0:.3g} {1}".format(seconds / size, unit)
+    return "{0:.3g} seconds".format(seconds)
+
+
+def report(result):
+    """Print a campaign plan"""
+    print("[+] Fields:")
+    for field in result["FIELDS"]:
+        print("\t[-] Field {0}: {1}, {2} bits, {3} mutations{4}".format(
+            field["FIELD"], field["TYPE"], field["LENGTH"],
+            field["MUTATIONS"], "" if field["FUZZABLE"] else " (static)"))
+    print("[+] Rate: {0:.0f} cases/s ({1}), {2} s between cases".format(
+        result["RATE"], result["RATE_SOURCE"], result["TIMEOUT"]))
+    print("[+] Cases:")
+    for mode, cases in result["CASES"].items():
+        print("\t[-] {0}: {1} cases, {2}".format(
+            mode, cases, human(result["DURATION"][mode])))
+    print("\t[-] deterministic stages: {0} cases, {1}".format(
+        result["DETERMINISTIC"], human(result["DURATION"]["deterministic"])))
+    if result["SUGGESTIONS"]:
+        print("[+] Suggestions to fit {0}:".format(human(result["BUDGET"])))
+        for suggestion in result["SUGGESTIONS"]:
+            print("\t[-] {0}".format(suggestion))
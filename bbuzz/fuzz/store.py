@@ -0,0 +1,370 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+import bbuzz.common
+
+import os
+import struct
+from hashlib import blake2b
+
+
+MAGIC = b"BBZR"
+RECORD = struct.Struct(">cQ")
+EXEMPLAR = struct.Struct(">QI")
+SUMMARY = struct.Struct(">QI")
+RANGE = struct.Struct(">QQ")
+MASK = struct.Struct(">I")
+# Width masked for counters, whose high bits rarely change in a baseline
+COUNTER_BITS = 32
+
+
+def counting(values, length):
+    """Check if field values step by a constant increment"""
+    steps = [
+            (second - first) % (1 << length)
+            for first, second in zip(values, values[1:])
+            ]
+    if len(steps) < 2:
+        return False
+    step = max(set(steps), key=steps.count)
+    return bool(step) and steps.count(step) >= 0.9 * len(steps)
+
+
+def widen_mask(mask, bits):
+    """Widen the variable runs of a mask to the known-variable groups:
+    whole bytes, and COUNTER_BITS for runs counting across bits"""
+    byte = bbuzz.common.BYTE
+    widened = list(mask)
+    position = 0
+    while position < len(mask):
+        if mask[position] != '*':
+            position += 1
+            continue
+        start = position
+        while position < len(mask) and mask[position] == '*':
+            position += 1
+        first = start - start % byte
+        last = min(-(-position // byte) * byte, len(mask))
+        values = [int(sample[first:last], 2) for sample in bits]
+        if counting(values, last - first):
+            first = max(last - COUNTER_BITS, 0)
+        widened[first:last] = '*' * (last - first)
+    return "".join(widened)
+
+
+def summary_record(fingerprint, entry):
+    """Return the count and ranges record of a fingerprint"""
+    return (
+            RECORD.pack(b"S", fingerprint) +
+            SUMMARY.pack(entry["COUNT"], len(entry["RANGES"])) +
+            b"".join(RANGE.pack(*r) for r in entry["RANGES"])
+            )
+
+
+class ResponseStore():
+    """Deduplicated store of target responses"""
+    def __init__(self, store_file, mask=None, max_fingerprints=65536, max_ranges=64,
+                 max_size=64 * 1024 * 1024, checkpoint=10000):
+        """
+        Responses are normalized by clearing their variable bits (sequence
+        numbers, timestamps, checksums), hashed into a fingerprint and
+        counted. Only the first response of every fingerprint is kept,
+        together with its hit count and the test case index ranges which
+        produced it.
+
+        store_file:     Append-only store file, resumed if it exists.
+        mask:           Response bit mask in bbuzz.common.payload_mask
+                        notation, * marking variable bits, e.g. from
+                        payload_mask over baseline captures. If not given,
+                        set it with calibrate() on replies to the
+                        unmutated reference case before fuzzing, otherwise
+                        responses are fingerprinted unmasked. The mask is
+                        never inferred from fuzzed replies, as it would
+                        hide the bits that differ between interesting
+                        responses.
+        max_fingerprints:   Distinct responses tracked. Further new ones
+                        are only counted as overflow.
+        max_ranges:     Case index ranges kept per fingerprint. Nearest
+                        ranges are merged above this limit.
+        max_size:       File size above which the store is compacted,
+                        once stale summaries make up half of the file.
+                        Exemplars are kept for the first half of max_size
+                        only, later fingerprints are stored without one.
+        checkpoint:     Responses between count and range checkpoints.
+
+        The file holds a mask record, one exemplar record per fingerprint
+        and summary records of counts and ranges. The last summary of a
+        fingerprint is authoritative.
+        """
+        self.store_file = store_file
+        self.max_fingerprints = max_fingerprints
+        self.max_ranges = max_ranges
+        self.max_size = max_size
+        self.checkpoint = checkpoint
+        self.entries = {}
+        self.dirty = set()
+        self.overflow = 0
+        self.since_checkpoint = 0
+        self.exemplar_bytes = 0
+        self.live_bytes = len(MAGIC)
+        self.mask = None
+        if os.path.exists(store_file):
+            self.load()
+        if self.mask is None and mask is not None:
+            self.set_mask(mask)
+        if os.path.exists(store_file):
+            self.maybe_compact()
+
+    def load(self):
+        """Read fingerprints, exemplar offsets and counts from the file"""
+        with open(self.store_file, 'rb') as store:
+            if store.read(len(MAGIC)) != MAGIC:
+                bbuzz.common.error_handler(
+                        "{0} is not a response store".format(self.store_file)
+                        )
+                return
+            while True:
+                header = store.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    break
+                kind, fingerprint = RECORD.unpack(header)
+                if kind == b"M":
+                    length = MASK.unpack(store.read(MASK.size))[0]
+                    self.apply_mask(store.read(length).decode())
+                    self.live_bytes += RECORD.size + MASK.size + length
+                elif kind == b"E":
+                    case, length = EXEMPLAR.unpack(store.read(EXEMPLAR.size))
+                    self.entries[fingerprint] = {
+                            "COUNT": 1,
+                            "RANGES": [[case, case]],
+                            "OFFSET": store.tell(),
+                            "LENGTH": length,
+                            "SUMMARY": 0
+                            }
+                    store.seek(length, os.SEEK_CUR)
+                    self.exemplar_bytes += length
+                    self.live_bytes += RECORD.size + EXEMPLAR.size + length
+                elif kind == b"S":
+                    count, ranges = SUMMARY.unpack(store.read(SUMMARY.size))
+                    data = store.read(ranges * RANGE.size)
+                    entry = self.entries.get(fingerprint)
+                    if entry is not None:
+                        size = RECORD.size + SUMMARY.size + len(data)
+                        self.live_bytes += size - entry["SUMMARY"]
+                        entry["SUMMARY"] = size
+                        entry["COUNT"] = count
+                        entry["RANGES"] = [
+                                list(RANGE.unpack_from(data, i * RANGE.size))
+                                for i in range(ranges)
+                                ]
+                else:
+                    bbuzz.common.error_handler(
+                            "Corrupt response store record, "
+                            "ignoring the rest of the file"
+                            )
+                    break
+
+    def apply_mask(self, mask):
+        """Prepare the AND mask clearing variable response bits"""
+        self.mask = mask
+        self.mask_length = len(mask) // bbuzz.common.BYTE
+        keep = mask[:self.mask_length * bbuzz.common.BYTE]
+        self.keep = int(
+                keep.replace('0', '1').replace('*', '0') or '0', 2
+                )
+
+    def set_mask(self, mask):
+        """Use and persist the response mask"""
+        self.apply_mask(mask)
+        record = RECORD.pack(b"M", 0) + MASK.pack(len(mask)) + mask.encode()
+        self.append(record)
+        self.live_bytes += len(record)
+
+    def append(self, record):
+        """Append a record to the store file"""
+        new_file = not os.path.exists(self.store_file)
+        with open(self.store_file, 'ab') as store:
+            if new_file:
+                store.write(MAGIC)
+            offset = store.tell()
+            store.write(record)
+        return offset
+
+    def normalize(self, response):
+        """Clear the variable bits of a response"""
+        length = min(len(response), self.mask_length)
+        if not length:
+            return response
+        shift = (self.mask_length - length) * bbuzz.common.BYTE
+        head = int.from_bytes(response[:length], 'big') & (self.keep >> shift)
+        return head.to_bytes(length, 'big') + response[length:]
+
+    def fingerprint(self, response):
+        """Return the 64-bit fingerprint of a response"""
+        normal = self.normalize(response) if self.mask else response
+        digest = blake2b(
+                struct.pack(">I", len(response)) + normal, digest_size=8
+                ).digest()
+        return struct.unpack(">Q", digest)[0]
+
+    def add(self, case, response):
+        """Record the response to test case number case.
+        An empty response stands for no reply."""
+        fingerprint = self.fingerprint(response)
+        entry = self.entries.get(fingerprint)
+        if entry is None:
+            if len(self.entries) >= self.max_fingerprints:
+                self.overflow += 1
+                return
+            exemplar = response
+            if self.exemplar_bytes + len(exemplar) > self.max_size // 2:
+                exemplar = b""
+            record = (
+                    RECORD.pack(b"E", fingerprint) +
+                    EXEMPLAR.pack(case, len(exemplar)) + exemplar
+                    )
+            offset = self.append(record)
+            self.exemplar_bytes += len(exemplar)
+            self.live_bytes += len(record)
+            self.entries[fingerprint] = {
+                    "COUNT": 1,
+                    "RANGES": [[case, case]],
+                    "OFFSET": offset + RECORD.size + EXEMPLAR.size,
+                    "LENGTH": len(exemplar),
+                    "SUMMARY": 0
+                    }
+        else:
+            entry["COUNT"] += 1
+            ranges = entry["RANGES"]
+            if ranges[-1][1] + 1 == case:
+                ranges[-1][1] = case
+            else:
+                ranges.append([case, case])
+                if len(ranges) > self.max_ranges:
+                    self.merge_ranges(ranges)
+            self.dirty.add(fingerprint)
+        self.since_checkpoint += 1
+        if self.since_checkpoint >= self.checkpoint:
+            self.flush()
+
+    def calibrate(self, responses):
+        """Learn and persist the response mask from baseline responses,
+        i.e. replies to repeated sends of the unmutated reference case.
+        Their differing bits are the variable ones (sequence numbers,
+        timestamps, checksums), widened to whole bytes. Counters are
+        masked COUNTER_BITS wide, as a short baseline only changes their
+        low bits. A resumed store keeps its fingerprints."""
+        if self.mask is not None or self.entries:
+            return
+        responses = [response for response in responses if response]
+        if len(responses) > 1:
+            length = min(len(response) for response in responses)
+            bits = [
+                    bbuzz.common.bytes2bin(
+                        response[:length], length * bbuzz.common.BYTE)
+                    for response in responses
+                    ]
+            self.set_mask(widen_mask(bbuzz.common.payload_mask(bits), bits))
+        else:
+            self.set_mask("")
+
+    def merge_ranges(self, ranges):
+        """Merge the two neighbouring ranges with the smallest gap"""
+        gaps = [
+                ranges[i + 1][0] - ranges[i][1]
+                for i in range(len(ranges) - 1)
+                ]
+        nearest = gaps.index(min(gaps))
+        ranges[nearest][1] = ranges[nearest + 1][1]
+        del ranges[nearest + 1]
+
+    def flush(self):
+        """Checkpoint counts and ranges of changed fingerprints"""
+        if not os.path.exists(self.store_file):
+            return
+        records = []
+        for fingerprint in self.dirty:
+            entry = self.entries[fingerprint]
+            record = summary_record(fingerprint, entry)
+            self.live_bytes += len(record) - entry["SUMMARY"]
+            entry["SUMMARY"] = len(record)
+            records.append(record)
+        if records:
+            self.append(b"".join(records))
+        self.dirty = set()
+        self.since_checkpoint = 0
+        self.maybe_compact()
+
+    def maybe_compact(self):
+        """Compact the store above max_size if at least half of the file
+        is stale summaries, so that compaction is never repeated for
+        nothing when the live records alone exceed max_size"""
+        size = os.path.getsize(self.store_file)
+        if size > self.max_size and size - self.live_bytes >= size // 2:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the store with a single summary per fingerprint"""
+        temporary = self.store_file + ".compact"
+        with open(self.store_file, 'rb') as old, \
+                open(temporary, 'wb') as new:
+            new.write(MAGIC)
+            if self.mask is not None:
+                new.write(RECORD.pack(b"M", 0) + MASK.pack(len(self.mask)) +
+                          self.mask.encode())
+            for fingerprint, entry in self.entries.items():
+                old.seek(entry["OFFSET"])
+                data = old.read(entry["LENGTH"])
+                new.write(RECORD.pack(b"E", fingerprint) +
+                          EXEMPLAR.pack(entry["RANGES"][0][0], len(data)))
+                entry["OFFSET"] = new.tell()
+                new.write(data)
+                record = summary_record(fingerprint, entry)
+                entry["SUMMARY"] = len(record)
+                new.write(record)
+            self.live_bytes = new.tell()
+        os.replace(temporary, self.store_file)
+        self.dirty = set()
+
+    def close(self):
+        """Write the final checkpoint"""
+        self.flush()
+
+    def exemplar(self, fingerprint):
+        """Return the first response seen with a fingerprint, empty if it
+        was not kept"""
+        entry = self.entries[fingerprint]
+        with open(self.store_file, 'rb') as store:
+            store.seek(entry["OFFSET"])
+            return store.read(entry["LENGTH"])
+
+    def summary(self):
+        """Return (fingerprint, count, ranges) of all responses, rarest
+        first, as rare responses are the interesting ones"""
+        return sorted(
+                (
+                    (fingerprint, entry["COUNT"], entry["RANGES"])
+                    for fingerprint, entry in self.entries.items()
+                    ),
+                key=lambda item: item[1]
+                )
+
+    def report(self, limit=20):
+        """Print the rarest responses"""
+        print("[+] Responses: {0} distinct, {1} overflow".format(
+            len(self.entries), self.overflow))
+        for fingerprint, count, ranges in self.summary()[:limit]:
+            exemplar = self.exemplar(fingerprint)
+            print("\t[-] {0:016x}: {1} hits, cases {2}, {3} bytes: {4}".format(
+                fingerprint, count,
+                ", ".join(
+                    str(a) if a == b else "{0}-{1}".format(a, b)
+                    for a, b in ranges[:4]
+                    ) + (" ..." if len(ranges) > 4 else ""),
+                len(exemplar), exemplar[:16].hex()
+                ))
@@ -9,6 +9,10 @@
 import bbuzz.common
 
 
+# Bump whenever the generated mutations change, invalidating cached tables
+VERSION = 1
+
+
 def binary(case, caselen):
     """Generate binary mutations"""
     mutations = []
@@ -78,3 +82,52 @@ def knownvalues(caselen):
             ("10"*(caselen * 2))[:caselen]
             )
     return values
+
+
+# Deterministic stages. Each stage has a computable case count and returns
+# the XOR mask of its index-th case directly, so stages can be sharded by
+# case index and applied to an integer compiled from the field value.
+ARITH_MAX = 35
+
+
+def walk_count(caselen, width):
+    """Number of walking flips of width adjacent bits"""
+    return max(caselen - width + 1, 0)
+
+
+def walk_mask(caselen, width, index):
+    """XOR mask of the index-th walking flip of width adjacent bits,
+    walking from the most significant bit"""
+    return ((1 << width) - 1) << (caselen - width - index)
+
+
+def byteflip_count(caselen):
+    """Number of whole byte flips"""
+    return caselen // bbuzz.common.BYTE
+
+
+def byteflip_mask(caselen, index):
+    """XOR mask inverting the index-th byte"""
+    step = bbuzz.common.BYTE
+    return 0xFF << (caselen - step * (index + 1))
+
+
+def arith_count(caselen):
+    """Number of per byte +/-N arithmetic cases"""
+    return caselen // bbuzz.common.BYTE * 2 * ARITH_MAX
+
+
+def arith_mask(value, caselen, index):
+    """XOR mask adding (even index) or subtracting (odd index) 1 to
+    ARITH_MAX to a single byte of the integer value, wrapping within the
+    byte"""
+    step = bbuzz.common.BYTE
+    byte, case = divmod(index, 2 * ARITH_MAX)
+    delta = case // 2 + 1
+    shift = caselen - step * (byte + 1)
+    old = (value >> shift) & 0xFF
+    if case % 2:
+        new = (old - delta) & 0xFF
+    else:
+        new = (old + delta) & 0xFF
+    return (old ^ new) << shift
@@ -0,0 +1,128 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+import bbuzz.common
+
+import mmap
+import os
+import struct
+import tempfile
+from hashlib import sha256
+
+
+MAGIC = b"BBZM"
+HEADER = struct.Struct(">4sIII")
+SUFFIX = ".bbm"
+
+
+class MutationTable():
+    """Read-only sequence of field mutations backed by a mapped file"""
+    def __init__(self, path):
+        """
+        The table file starts with a header of magic, field length in bits,
+        mutation count and record stride in bytes, followed by one fixed
+        stride record of packed bits per mutation. The file is mapped
+        read-only, so concurrent workers share a single physical copy.
+        """
+        with open(path, 'rb') as table:
+            self.map = mmap.mmap(table.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.length, self.count, self.stride = HEADER.unpack_from(
+                self.map
+                )
+        if magic != MAGIC:
+            raise ValueError("{0} is not a mutation table".format(path))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("mutation table index out of range")
+        offset = HEADER.size + index * self.stride
+        value = int.from_bytes(self.map[offset:offset + self.stride], 'big')
+        bits = bin(value)[2:].zfill(self.stride * bbuzz.common.BYTE)
+        return bits[:self.length]
+
+
+class MutationCache():
+    """Size bounded directory of mutation tables with LRU eviction"""
+    def __init__(self, directory, max_size=256 * 1024 * 1024):
+        """
+        Cache per field mutation tables across runs and processes. Tables
+        are keyed by field value, length, type and mutator version. When
+        the directory grows above max_size bytes, the least recently used
+        tables are removed.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, data, data_len, data_type, version):
+        """Return the table file path of a field"""
+        key = "{0}:{1}:{2}:{3}".format(version, data_type, data_len, data)
+        return os.path.join(
+                self.directory,
+                sha256(key.encode('utf-8')).hexdigest() + SUFFIX
+                )
+
+    def get(self, data, data_len, data_type, version, generate):
+        """Return the mapped mutation table of a field, calling generate()
+        to compute and store it on a miss"""
+        path = self.path(data, data_len, data_type, version)
+        try:
+            table = MutationTable(path)
+            os.utime(path)
+            return table
+        except (OSError, ValueError, struct.error):
+            pass
+        mutations = generate()
+        if not mutations or any(len(m) != len(data) for m in mutations):
+            # Only fixed length tables can be stored with a fixed stride
+            return mutations
+        self.store(path, mutations)
+        self.evict()
+        try:
+            return MutationTable(path)
+        except (OSError, ValueError, struct.error):
+            return mutations
+
+    def store(self, path, mutations):
+        """Write a table atomically, so readers never map a partial file"""
+        length = len(mutations[0])
+        stride = -(-length // bbuzz.common.BYTE)
+        padding = "0" * (stride * bbuzz.common.BYTE - length)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(descriptor, 'wb') as table:
+            table.write(HEADER.pack(MAGIC, length, len(mutations), stride))
+            for mutation in mutations:
+                table.write(int(mutation + padding, 2).to_bytes(stride, 'big'))
+        os.replace(temporary, path)
+
+    def evict(self):
+        """Remove least recently used tables above the size limit"""
+        tables = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                try:
+                    status = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                tables.append((status.st_mtime, status.st_size, name))
+        total = sum(size for _, size, _ in tables)
+        for _, size, name in sorted(tables):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
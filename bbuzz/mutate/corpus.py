@@ -0,0 +1,108 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+import bbuzz.common
+
+import os
+import random
+import struct
+from hashlib import blake2b
+from math import log
+
+
+MAGIC = b"BBZC"
+RECORD = struct.Struct(">QI")
+
+
+def signature(response, elapsed, type_offset=0):
+    """Reduce a target response to a 64-bit signature made of the reply
+    length, the reply type code byte and a logarithmic timing bucket"""
+    if response:
+        type_code = response[type_offset:type_offset + 1]
+    else:
+        type_code = b""
+    timing = int(log(max(elapsed, 1e-6) * 1e6, 2))
+    digest = blake2b(
+            struct.pack(">IH", len(response), timing) + type_code,
+            digest_size=8
+            ).digest()
+    return struct.unpack(">Q", digest)[0]
+
+
+class Corpus():
+    """Interesting mutants kept on disk, keyed by response signature"""
+    def __init__(self, field_lengths, corpus_file=None):
+        """
+        Store mutants which produced a new response signature in a compact
+        append-only file. Each record holds the signature, the payload
+        length in bits and the packed payload bits. Records written for a
+        payload of a different length are ignored on load.
+        """
+        self.field_lengths = field_lengths
+        self.payload_length = sum(field_lengths)
+        self.corpus_file = corpus_file
+        self.entries = []
+        self.hits = {}
+        if corpus_file and os.path.exists(corpus_file):
+            self.load()
+
+    def load(self):
+        """Read all stored mutants from the corpus file"""
+        with open(self.corpus_file, 'rb') as corpus:
+            if corpus.read(len(MAGIC)) != MAGIC:
+                bbuzz.common.error_handler(
+                        "{0} is not a corpus file".format(self.corpus_file)
+                        )
+                return
+            while True:
+                header = corpus.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    break
+                sig, bitlen = RECORD.unpack(header)
+                data = corpus.read(-(-bitlen // bbuzz.common.BYTE))
+                if bitlen == self.payload_length:
+                    self.entries.append((sig, self.split(data)))
+                    self.hits[sig] = self.hits.get(sig, 0) + 1
+
+    def split(self, data):
+        """Cut packed payload bits back into fields"""
+        bits = bbuzz.common.bytes2bin(data, len(data) * bbuzz.common.BYTE)
+        fields = []
+        position = 0
+        for length in self.field_lengths:
+            fields.append(bits[position:position + length])
+            position += length
+        return fields
+
+    def seen(self, sig):
+        """Count a signature hit and report if it was seen before"""
+        known = sig in self.hits
+        self.hits[sig] = self.hits.get(sig, 0) + 1
+        return known
+
+    def add(self, sig, fields):
+        """Keep a mutant for a new signature"""
+        self.entries.append((sig, list(fields)))
+        if not self.corpus_file:
+            return
+        bits = bbuzz.common.load_assemble(fields)
+        padding = -len(bits) % bbuzz.common.BYTE
+        data = bbuzz.common.bin2bytes(bits + "0" * padding)
+        new_file = not os.path.exists(self.corpus_file)
+        with open(self.corpus_file, 'ab') as corpus:
+            if new_file:
+                corpus.write(MAGIC)
+            corpus.write(RECORD.pack(sig, len(bits)) + data)
+
+    def choose(self):
+        """Pick a mutant, preferring those with rarely seen signatures"""
+        weights = [1.0 / self.hits.get(sig, 1) for sig, _ in self.entries]
+        return random.choices(self.entries, weights)[0][1]
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,33 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+import random
+
+
+def bitflip(case, caselen, count=1):
+    """Flip count randomly chosen bits"""
+    value = int(case, 2)
+    for bit in random.sample(range(caselen), min(count, caselen)):
+        value ^= 1 << bit
+    return bin(value)[2:].zfill(caselen)
+
+
+def crossover(parent, donor, fuzzable):
+    """Take every fuzzable field from either parent at random"""
+    child = list(parent)
+    for field_number in fuzzable:
+        if random.getrandbits(1):
+            child[field_number] = donor[field_number]
+    return child
+
+
+def splice(case, known):
+    """Replace the field with one of its known bad values"""
+    if known:
+        return random.choice(known)
+    return case
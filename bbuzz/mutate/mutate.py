@@ -13,8 +13,53 @@ import bbuzz.mutate.numeric
 import bbuzz.mutate.static
 import bbuzz.mutate.string
 import bbuzz.mutate.random
+import bbuzz.mutate.evolve
+import bbuzz.mutate.corpus
+import bbuzz.mutate.cache
 
-from itertools import product
+import random
+from bisect import bisect_right
+from itertools import islice
+
+
+# Deterministic stages: (name, case count, XOR mask of index-th case)
+STAGES = (
+        ("flip1",
+            lambda value, length: bbuzz.mutate.binary.walk_count(length, 1),
+            lambda value, length, index: bbuzz.mutate.binary.walk_mask(
+                length, 1, index)),
+        ("flip2",
+            lambda value, length: bbuzz.mutate.binary.walk_count(length, 2),
+            lambda value, length, index: bbuzz.mutate.binary.walk_mask(
+                length, 2, index)),
+        ("flip4",
+            lambda value, length: bbuzz.mutate.binary.walk_count(length, 4),
+            lambda value, length, index: bbuzz.mutate.binary.walk_mask(
+                length, 4, index)),
+        ("flip8",
+            lambda value, length: bbuzz.mutate.binary.byteflip_count(length),
+            lambda value, length, index: bbuzz.mutate.binary.byteflip_mask(
+                length, index)),
+        ("arith8",
+            lambda value, length: bbuzz.mutate.binary.arith_count(length),
+            bbuzz.mutate.binary.arith_mask),
+        )
+
+
+def combine_count(sizes, mode="product"):
+    """Number of known bad cases for fields with the given mutation counts,
+    the first mutation of every field being its reference value"""
+    if mode == "product":
+        count = 1
+        for size in sizes:
+            count *= size
+        return count
+    extra = [size - 1 for size in sizes]
+    count = 1 + sum(extra)
+    if mode == "pairwise":
+        total = sum(extra)
+        count += (total * total - sum(e * e for e in extra)) // 2
+    return count
 
 
 class Mutate():
@@ -38,14 +83,80 @@ class Mutate():
             generator. If STATIC and RANDOM are both used, the first generator to
             be used is the STATIC one and, after the known mutations have depleted,
             the RANDOM engine will be initialized.
+
+        EVOLVE: BOOL_TRUE-FALSE
+            Enable the response guided evolutionary engine. Mutants, which
+            produce a previously unseen response signature (reply length,
+            type code, timing bucket), are kept in a corpus and mutated
+            further with field-aware crossover, bit flip and known value
+            splice operators. Response feedback has to be supplied with
+            feedback(), which Fuzz.fuzz does automatically. EVOLVE runs
+            after STATIC and takes the place of RANDOM.
+
+        CORPUS: "STR_FILE_PATH"
+            Optional file where the EVOLVE corpus is stored and resumed from.
+
+        TYPE_OFFSET: INT_BYTE_OFFSET
+            Offset of the type code byte within target responses used for
+            the EVOLVE response signature. Defaults to 0.
+
+        DETERMINISTIC: BOOL_TRUE-FALSE
+            Enable the deterministic stages: walking 1, 2 and 4 bit flips,
+            byte flips and +/-1..35 arithmetic on every byte of each
+            fuzzable field. Each case is an XOR mask over the compiled
+            payload, its count is known up front (case_count()) and any
+            case can be generated directly by index (case()). Runs after
+            STATIC and before EVOLVE and RANDOM.
+
+        COMBINE: "STR_MODE"
+            How STATIC combines the field mutations:
+            product - every combination of all fields (default)
+            pairwise - every pair of values of any two fields, with all
+                other fields at their reference value
+            single - every value of one field at a time
+            See combine_count() for the resulting case counts.
+
+        CACHE: "STR_DIRECTORY_PATH"
+            Optional directory where STATIC field mutation tables are kept
+            across runs. Tables are memory mapped, so concurrent workers
+            share them instead of recomputing them.
+
+        CACHE_SIZE: INT_BYTES
+            Size limit of the CACHE directory. Least recently used tables
+            are evicted above it. Defaults to 256 MiB.
         """
         self.payload = mutate_payload
         self.options = mutate_options
+        self.last_mutation = None
+        self.cache = None
+        if self.options.get("CACHE"):
+            self.cache = bbuzz.mutate.cache.MutationCache(
+                    self.options["CACHE"],
+                    self.options.get("CACHE_SIZE", 256 * 1024 * 1024)
+                    )
         self.convert()
-        if self.options["STATIC"]:
+        self.known_total = 0
+        self.stage_total = 0
+        if self.options["STATIC"] or self.options.get("EVOLVE"):
             self.mutate()
+        if self.options["STATIC"]:
+            self.known_total = self.known_count()
         if self.options["RANDOM"]:
             self.random_mutations = self.gen_random()
+        if self.options.get("DETERMINISTIC"):
+            self.compile()
+            self.deterministic_cases = iter(range(self.case_count()))
+        if self.options.get("EVOLVE"):
+            self.corpus = bbuzz.mutate.corpus.Corpus(
+                    [
+                        self.payload.bitfield_length(field_number)
+                        for field_number in range(self.payload.field_count())
+                        ],
+                    self.options.get("CORPUS")
+                    )
+            if not len(self.corpus):
+                self.corpus.add(0, self.bitfields)
+            self.evolve_mutations = self.gen_evolve()
 
     def convert(self):
         """Convert all field values to binary data"""
@@ -101,9 +212,11 @@ class Mutate():
                 data_type = self.payload.bitfield_type(field_number)
                 data_len = self.payload.bitfield_length(field_number)
                 if data_type == "binary":
-                    self.mutations[field_number] = bbuzz.mutate.binary.binary(
-                                                    data, data_len
-                                                    )
+                    self.mutations[field_number] = self.cached(
+                            data, data_len, data_type,
+                            bbuzz.mutate.binary.VERSION,
+                            bbuzz.mutate.binary.binary
+                            )
                 # TODO: Implement all other mutation types
                 elif data_type == "numeric":
                     self.mutations[field_number] = [data]
@@ -120,7 +233,155 @@ class Mutate():
             else:
                 self.mutations[field_number] = [data]
 
-        self.known_mutations = product(*self.mutations)
+        self.known_mutations = self.gen_known()
+
+    def known_count(self):
+        """Return the number of known bad cases of the COMBINE mode"""
+        return combine_count(
+                [len(mutations) for mutations in self.mutations],
+                self.options.get("COMBINE", "product")
+                )
+
+    def known_case(self, index):
+        """Return the index-th known bad case in generation order"""
+        mutation = [mutations[0] for mutations in self.mutations]
+        if self.options.get("COMBINE", "product") == "product":
+            for field_number in reversed(range(len(self.mutations))):
+                index, digit = divmod(
+                        index, len(self.mutations[field_number])
+                        )
+                mutation[field_number] = self.mutations[field_number][digit]
+            return tuple(mutation)
+        # Reference case, then every single field value, then every pair
+        # of field values, all other fields keeping their reference value
+        if index == 0:
+            return tuple(mutation)
+        index -= 1
+        extra = [len(mutations) - 1 for mutations in self.mutations]
+        for field_number, count in enumerate(extra):
+            if index < count:
+                mutation[field_number] = self.mutations[field_number][
+                        index + 1
+                        ]
+                return tuple(mutation)
+            index -= count
+        for first in range(len(extra)):
+            for second in range(first + 1, len(extra)):
+                block = extra[first] * extra[second]
+                if index < block:
+                    a, b = divmod(index, extra[second])
+                    mutation[first] = self.mutations[first][a + 1]
+                    mutation[second] = self.mutations[second][b + 1]
+                    return tuple(mutation)
+                index -= block
+        raise IndexError("known case index out of range")
+
+    def indexed_count(self):
+        """Return the size of the indexed mutation space: the known bad
+        cases (STATIC) followed by the deterministic stage cases"""
+        return self.known_total + self.stage_total
+
+    def indexed_case(self, index):
+        """Return the index-th case of the indexed mutation space as bytes,
+        independently of the generation state"""
+        if index < self.known_total:
+            return self.assemble_payload(self.known_case(index))
+        return self.case(index - self.known_total)
+
+    def cached(self, data, data_len, data_type, version, mutator):
+        """Return the field mutations, from the table cache if enabled"""
+        if self.cache is None:
+            return mutator(data, data_len)
+        return self.cache.get(
+                data, data_len, data_type, version,
+                lambda: mutator(data, data_len)
+                )
+
+    def gen_known(self):
+        """Generate the known bad cases. The product of all field mutations
+        is generated in itertools.product order, indexing the field
+        mutation tables instead of copying them"""
+        if self.options.get("COMBINE", "product") != "product":
+            for index in range(self.known_count()):
+                yield self.known_case(index)
+            return
+        sizes = [len(mutations) for mutations in self.mutations]
+        if not all(sizes):
+            return
+        counters = [0] * len(sizes)
+        current = [mutations[0] for mutations in self.mutations]
+        while True:
+            yield tuple(current)
+            for field_number in reversed(range(len(sizes))):
+                counters[field_number] += 1
+                if counters[field_number] < sizes[field_number]:
+                    current[field_number] = self.mutations[field_number][
+                            counters[field_number]
+                            ]
+                    break
+                counters[field_number] = 0
+                current[field_number] = self.mutations[field_number][0]
+            else:
+                return
+
+    def compile(self):
+        """Compile the payload into a single integer and index the
+        deterministic stage cases of every fuzzable field"""
+        self.frame_length = sum(len(field) for field in self.bitfields)
+        self.stage_starts = []
+        self.stage_table = []
+        self.stage_total = 0
+        if self.frame_length % bbuzz.common.BYTE:
+            bbuzz.common.error_handler(
+                    "Payload is not BYTE aligned for deterministic stages"
+                    )
+            return
+        self.frame = int(bbuzz.common.load_assemble(self.bitfields), 2)
+        total = 0
+        shift = self.frame_length
+        for field_number, data in enumerate(self.bitfields):
+            shift -= len(data)
+            if not self.payload.bitfield_fuzzable(field_number):
+                continue
+            value = int(data, 2)
+            for name, count, mask in STAGES:
+                cases = count(value, len(data))
+                if cases:
+                    self.stage_starts.append(total)
+                    self.stage_table.append(
+                            (name, field_number, shift, value, len(data), mask)
+                            )
+                    total += cases
+        self.stage_total = total
+
+    def case_count(self):
+        """Return the number of deterministic stage cases"""
+        return self.stage_total
+
+    def case_stage(self, index):
+        """Return the stage name and field number of a deterministic case"""
+        entry = self.stage_table[bisect_right(self.stage_starts, index) - 1]
+        return entry[0], entry[1]
+
+    def case(self, index):
+        """Return the index-th deterministic stage case as bytes"""
+        position = bisect_right(self.stage_starts, index) - 1
+        _, _, shift, value, length, mask = self.stage_table[position]
+        local = index - self.stage_starts[position]
+        frame = self.frame ^ (mask(value, length, local) << shift)
+        return frame.to_bytes(self.frame_length // bbuzz.common.BYTE, 'big')
+
+    def split_frame(self, frame_bytes):
+        """Cut an assembled payload back into its binary field values"""
+        bits = bbuzz.common.bytes2bin(
+                frame_bytes, len(frame_bytes) * bbuzz.common.BYTE
+                )
+        fields = []
+        position = 0
+        for data in self.bitfields:
+            fields.append(bits[position:position + len(data)])
+            position += len(data)
+        return fields
 
     def gen_random(self):
         """"Generate random mutations"""
@@ -140,6 +401,63 @@ class Mutate():
 
             yield mutation
 
+    def gen_evolve(self):
+        """Generate mutations from the corpus of interesting mutants"""
+        fuzzable = [
+                field_number
+                for field_number in range(self.payload.field_count())
+                if self.payload.bitfield_fuzzable(field_number)
+                ]
+        while fuzzable:
+            mutation = list(self.corpus.choose())
+            operator = random.randrange(3)
+            if operator == 0 and len(self.corpus) > 1:
+                mutation = bbuzz.mutate.evolve.crossover(
+                        mutation, self.corpus.choose(), fuzzable
+                        )
+            field_number = random.choice(fuzzable)
+            data_len = self.payload.bitfield_length(field_number)
+            if operator == 1:
+                mutation[field_number] = bbuzz.mutate.evolve.splice(
+                        mutation[field_number],
+                        self.mutations[field_number]
+                        )
+            else:
+                mutation[field_number] = bbuzz.mutate.evolve.bitflip(
+                        mutation[field_number],
+                        data_len,
+                        random.choice((1, 2, 4))
+                        )
+            yield mutation
+
+    def shard(self, shard_number, shard_count):
+        """Restrict this instance to every shard_count-th known bad and
+        deterministic case, starting with case shard_number, for parallel
+        generation. Random engines are reseeded so that shards do not
+        repeat each other."""
+        if self.options["STATIC"]:
+            self.known_mutations = islice(
+                    self.known_mutations, shard_number, None, shard_count
+                    )
+        if self.options.get("DETERMINISTIC"):
+            self.deterministic_cases = iter(
+                    range(shard_number, self.case_count(), shard_count)
+                    )
+        random.seed()
+
+    def feedback(self, response, elapsed):
+        """Record the target response to the last returned mutation and
+        keep the mutation in the corpus if the response is new"""
+        if not self.options.get("EVOLVE") or self.last_mutation is None:
+            return False
+        sig = bbuzz.mutate.corpus.signature(
+                response, elapsed, self.options.get("TYPE_OFFSET", 0)
+                )
+        if self.corpus.seen(sig):
+            return False
+        self.corpus.add(sig, self.last_mutation)
+        return True
+
     def assemble_payload(self, mutant_instance):
         """Assemble all the fields bitwise and convert into bytes for network
         transmission."""
@@ -147,16 +465,39 @@ class Mutate():
         payload_bytes = bbuzz.common.bin2bytes(payload_bits)
         return payload_bytes
 
+    def reference(self):
+        """Return the unmutated payload as bytes"""
+        return self.assemble_payload(self.bitfields)
+
     def get(self):
         """Return the next mutation for sending over network socket"""
         if self.options["STATIC"]:
             try:
                 mutation_instance = next(self.known_mutations)
                 mutation_bytes = self.assemble_payload(mutation_instance)
+                self.last_mutation = mutation_instance
                 return mutation_bytes
             except StopIteration:
                 self.options["STATIC"] = False
                 return "__END"
+        elif self.options.get("DETERMINISTIC"):
+            try:
+                mutation_bytes = self.case(next(self.deterministic_cases))
+                if self.options.get("EVOLVE"):
+                    self.last_mutation = self.split_frame(mutation_bytes)
+                return mutation_bytes
+            except StopIteration:
+                self.options["DETERMINISTIC"] = False
+                return "__END"
+        elif self.options.get("EVOLVE"):
+            try:
+                mutation_instance = next(self.evolve_mutations)
+                mutation_bytes = self.assemble_payload(mutation_instance)
+                self.last_mutation = mutation_instance
+                return mutation_bytes
+            except StopIteration:
+                self.options["EVOLVE"] = False
+                return "__FIN"
         elif self.options["RANDOM"] and not self.options["STATIC"]:
             try:
                 mutation_instance = next(self.random_mutations)
@@ -13,7 +13,9 @@ from hashlib import sha256
 
 class Payload():
     """Payload Class"""
-    bit_fields = []
+    def __init__(self):
+        """Start an empty payload specification owned by this instance"""
+        self.bit_fields = []
 
     def add(self, bit_field_data, bit_field_options):
         """
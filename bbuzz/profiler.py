@@ -0,0 +1,212 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+import os
+import signal
+from collections import Counter
+from time import perf_counter, process_time
+
+
+# Pipeline stage entry points as (source file, function name). A sample is
+# tagged with the stage of the innermost entry point on its stack.
+STAGES = {
+        ("mutate.py", "get"): "generate",
+        ("session.py", "get"): "generate",
+        ("mutate.py", "case"): "generate",
+        ("mutate.py", "mutate"): "generate",
+        ("mutate.py", "convert"): "generate",
+        ("pipeline.py", "produce"): "generate",
+        ("mutate.py", "assemble_payload"): "assemble",
+        ("protocol.py", "fixup"): "fixup",
+        ("protocol.py", "send"): "send",
+        ("protocol.py", "send_batch"): "send",
+        ("protocol.py", "send_sequence"): "send",
+        ("protocol.py", "create"): "send",
+        ("loopback.py", "send"): "send",
+        ("loopback.py", "create"): "send",
+        ("protocol.py", "receive"): "monitor",
+        ("loopback.py", "receive"): "monitor",
+        ("mutate.py", "feedback"): "monitor",
+        ("fuzz.py", "monitor"): "monitor",
+        ("common.py", "payload_analyze"): "analyze",
+        ("infer.py", "infer_fields"): "analyze",
+        ("capture.py", "__init__"): "analyze",
+        ("entropy.py", "entropy_maps"): "analyze",
+        ("entropy.py", "group_entropy"): "analyze",
+        ("entropy.py", "window_entropy"): "analyze",
+        }
+
+
+def frame_name(code):
+    """Collapsed stack name of a code object"""
+    return "{0}:{1}".format(
+            os.path.basename(code.co_filename), code.co_name
+            ).replace(" ", "_")
+
+
+def frame_stage(code):
+    """Stage tagged to a code object, if any"""
+    return STAGES.get((os.path.basename(code.co_filename), code.co_name))
+
+
+class Profiler():
+    """Bounded window profiler with per-stage accounting"""
+    def __init__(self, window=30.0, mode="sample", interval=0.001,
+                 output="bbuzz-profile"):
+        """
+        Profile the main thread for window seconds.
+
+        mode:       "sample" - low overhead statistical profiler, sampling
+                    the stack every interval seconds of consumed CPU time.
+                    "cprofile" - deterministic cProfile, slower but exact.
+                    Call stacks of its collapsed output are approximated
+                    from the heaviest caller of each function.
+        output:     Path prefix of the written files:
+                    PREFIX.collapsed - collapsed stacks, rooted at the
+                    stage, for flamegraph.pl or speedscope
+                    PREFIX.stages - per-stage time summary
+                    PREFIX.pstats - raw cProfile statistics (cprofile only)
+
+        Only the main thread is profiled, as samples are taken by signal
+        handlers. Generator processes of Fuzz.pipeline are not included.
+        """
+        self.window = window
+        self.mode = mode
+        self.interval = interval
+        self.output = output
+        self.stacks = Counter()
+        self.running = False
+        self.profile = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def start(self):
+        """Start profiling until the window expires or stop() is called"""
+        self.running = True
+        self.started = perf_counter()
+        self.cpu_started = process_time()
+        if self.mode == "cprofile":
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.previous = signal.signal(signal.SIGALRM, self.expire)
+            signal.setitimer(signal.ITIMER_REAL, self.window)
+            self.profile.enable()
+        else:
+            self.previous = signal.signal(signal.SIGPROF, self.sample)
+            signal.setitimer(
+                    signal.ITIMER_PROF, self.interval, self.interval
+                    )
+
+    def sample(self, signum, frame):
+        """SIGPROF handler: record the interrupted stack"""
+        names = []
+        stage = None
+        while frame is not None:
+            code = frame.f_code
+            names.append(frame_name(code))
+            if stage is None:
+                stage = frame_stage(code)
+            frame = frame.f_back
+        names.append(stage or "other")
+        self.stacks[";".join(reversed(names))] += 1
+        if perf_counter() - self.started >= self.window:
+            self.stop()
+
+    def expire(self, signum, frame):
+        """SIGALRM handler: end of the cProfile window"""
+        self.stop()
+
+    def stop(self):
+        """Stop profiling and write the results"""
+        if not self.running:
+            return
+        self.running = False
+        self.elapsed = perf_counter() - self.started
+        self.cpu_time = process_time() - self.cpu_started
+        if self.mode == "cprofile":
+            self.profile.disable()
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self.previous)
+            self.collapse_cprofile()
+        else:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self.previous)
+        self.write()
+
+    def collapse_cprofile(self):
+        """Build approximate collapsed stacks from cProfile statistics,
+        weighted by own time in microseconds"""
+        import pstats
+        stats = pstats.Stats(self.profile).stats
+        self.profile.dump_stats(self.output + ".pstats")
+
+        def name(function):
+            filename, _, funcname = function
+            return "{0}:{1}".format(
+                    os.path.basename(filename), funcname
+                    ).replace(" ", "_")
+
+        for function, (_, _, tottime, _, callers) in stats.items():
+            chain = [function]
+            seen = {function}
+            while callers:
+                caller = max(callers, key=lambda c: callers[c][3])
+                if caller in seen:
+                    break
+                chain.append(caller)
+                seen.add(caller)
+                callers = stats.get(caller, (0, 0, 0, 0, {}))[4]
+            stage = None
+            for link in chain:
+                stage = STAGES.get(
+                        (os.path.basename(link[0]), link[2])
+                        )
+                if stage:
+                    break
+            stack = [stage or "other"] + [name(f) for f in reversed(chain)]
+            weight = int(tottime * 1e6)
+            if weight:
+                self.stacks[";".join(stack)] += weight
+
+    def summary(self):
+        """Return the profiled time per stage as (seconds, share).
+        Sampled seconds are the share of CPU time used in the window, as
+        the kernel may merge profiling signals under load."""
+        total = sum(self.stacks.values())
+        if self.mode == "cprofile":
+            unit = 1e-6
+        else:
+            unit = self.cpu_time / total if total else 0.0
+        stages = Counter()
+        for stack, count in self.stacks.items():
+            stages[stack.split(";", 1)[0]] += count
+        return {
+                stage: (count * unit, count / total if total else 0.0)
+                for stage, count in stages.most_common()
+                }
+
+    def write(self):
+        """Write collapsed stacks and the stage summary"""
+        with open(self.output + ".collapsed", 'w') as collapsed:
+            for stack, count in self.stacks.most_common():
+                collapsed.write("{0} {1}\n".format(stack, count))
+        lines = ["[+] Profile: {0} mode, {1:.2f} s window".format(
+            self.mode, self.elapsed)]
+        for stage, (seconds, share) in self.summary().items():
+            lines.append("\t[-] {0}: {1:.3f} s ({2:.1%})".format(
+                stage, seconds, share))
+        with open(self.output + ".stages", 'w') as stages:
+            stages.write("\n".join(lines) + "\n")
+        print("\n".join(lines))
+        print("[+] Profile written to {0}.collapsed".format(self.output))
@@ -6,3 +6,4 @@
 # Please see LICENSE file for more details
 
 from .protocol import Protocol
+from .loopback import Loopback
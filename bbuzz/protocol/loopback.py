@@ -0,0 +1,257 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+import bbuzz.common
+from bbuzz.protocol.protocol import Protocol
+
+import multiprocessing
+import select
+import socket
+import struct
+from time import perf_counter
+
+
+ETHER_HEADER = 14
+IPV6_HEADER = 40
+UDP_HEADER = 8
+IPPROTO_UDP = 17
+IPPROTO_ICMPV6 = 58
+
+
+class Loopback(Protocol):
+    """Protocol delivering test cases to a local simulated target"""
+    def __init__(self, protocol_layer, protocol_options={}):
+        """
+        Drop-in replacement of Protocol that needs neither raw sockets nor
+        a network interface. Test cases are passed over a socket pair to a
+        simulated target process, which parses them and answers like a
+        minimal IPv6/UDP stack:
+        - UDP to a listening port is echoed back
+        - UDP to any other port gets ICMPv6 destination unreachable
+        - ICMPv6 echo requests get echo replies
+        - other next headers get ICMPv6 parameter problem
+        - malformed packets are dropped silently
+
+        protocol_layer: 'raw2' - Ethernet framing is added as by Protocol
+                        and the target expects IPv6 inside.
+                        'raw3' - the test case is the IPv6 packet.
+                        'raw4' - the test case is the UDP payload, which
+                        is echoed back.
+        protocol_options:   The Protocol options of the layer, plus:
+                        "PORTS": [INT_PORT_NUMBER] listening UDP ports,
+                        defaults to [7].
+                        "CRASH": [{"OFFSET": INT_BIT_OFFSET,
+                                   "LENGTH": INT_BIT_LENGTH,
+                                   "VALUE": INT_VALUE}]
+                        The target "crashes" when a field of the test case
+                        payload holds the given value, i.e. it records the
+                        case and ignores everything for CRASH_RESTART
+                        seconds.
+                        "CRASH_RESTART": FLOAT_SECONDS, defaults to 0.
+
+        On kill() the target reports its receive statistics, which are
+        printed and kept in the stats attribute.
+        """
+        Protocol.__init__(self, protocol_layer, protocol_options)
+        self.stats = None
+
+    def create(self, interface="loopback"):
+        """Start the simulated target"""
+        if self.sock:
+            return self.sock
+        self.sock, target_sock = socket.socketpair(
+                socket.AF_UNIX, socket.SOCK_SEQPACKET
+                )
+        context = multiprocessing.get_context("fork")
+        self.results, results = context.Pipe(duplex=False)
+        self.target = context.Process(
+                target=serve,
+                args=(target_sock, self.layer, self.options, results),
+                daemon=True
+                )
+        self.target.start()
+        target_sock.close()
+        return self.sock
+
+    def send(self, data):
+        """Deliver a test case to the simulated target"""
+        if self.layer == 'raw2':
+            src_mac = bbuzz.common.mac2hex(
+                    self.options.get("SOURCE_MAC", "02:00:00:00:00:01"))
+            dst_mac = bbuzz.common.mac2hex(
+                    self.options.get("DESTINATION_MAC", "02:00:00:00:00:02"))
+            ethertype = bytes.fromhex(
+                    self.options.get("ETHER_TYPE", "0x86DD")[2:])
+            self.sock.send(dst_mac + src_mac + ethertype + data)
+        else:
+            self.sock.send(data)
+
+    def send_batch(self, frames):
+        """Deliver several test cases, the simulated target has no raw3
+        header template"""
+        for frame in frames:
+            self.send(frame)
+
+    def receive(self, timeout=0.1, size=65535):
+        """Wait for a reply of the simulated target"""
+        ready, _, _ = select.select([self.sock], [], [], timeout)
+        if not ready:
+            return b""
+        return self.sock.recv(size)
+
+    def kill(self):
+        """Stop the simulated target and report its statistics"""
+        if not self.sock:
+            return
+        self.sock.shutdown(socket.SHUT_WR)
+        # Drain unread replies so the target is never blocked on us
+        while True:
+            try:
+                if not self.sock.recv(65535):
+                    break
+            except OSError:
+                break
+        self.stats = self.results.recv()
+        self.target.join()
+        self.sock.close()
+        self.sock = False
+        report(self.stats)
+
+
+def crashed(payload, rules):
+    """Check if a payload matches any crash rule"""
+    if not rules:
+        return False
+    value = int.from_bytes(payload, 'big')
+    length = len(payload) * bbuzz.common.BYTE
+    for rule in rules:
+        shift = length - rule["OFFSET"] - rule["LENGTH"]
+        if shift < 0:
+            continue
+        field = (value >> shift) & ((1 << rule["LENGTH"]) - 1)
+        if field == rule["VALUE"]:
+            return True
+    return False
+
+
+def ipv6_packet(src, dst, next_header, payload):
+    """Build an IPv6 packet"""
+    return struct.pack(
+            ">IHBB16s16s", 6 << 28, len(payload), next_header, 64, src, dst
+            ) + payload
+
+
+def pseudo_checksum(src, dst, next_header, payload):
+    """Internet checksum over the IPv6 pseudo header and payload"""
+    pseudo = struct.pack(">16s16sI3xB", src, dst, len(payload), next_header)
+    return bbuzz.common.checksum(pseudo + payload)
+
+
+def icmpv6(src, dst, icmp_type, code, body):
+    """Build an ICMPv6 packet from src to dst"""
+    message = struct.pack(">BBH", icmp_type, code, 0) + body
+    check = pseudo_checksum(src, dst, IPPROTO_ICMPV6, message)
+    message = message[:2] + struct.pack(">H", check) + message[4:]
+    return ipv6_packet(src, dst, IPPROTO_ICMPV6, message)
+
+
+def respond_ipv6(packet, ports):
+    """Answer an IPv6 packet like a minimal host stack"""
+    if len(packet) < IPV6_HEADER or packet[0] >> 4 != 6:
+        return b""
+    payload_length, next_header = struct.unpack(">HB", packet[4:7])
+    if IPV6_HEADER + payload_length != len(packet):
+        return b""
+    src, dst = packet[8:24], packet[24:40]
+    payload = packet[IPV6_HEADER:]
+    # ICMPv6 errors quote as much of the offending packet as fits
+    quote = packet[:1232]
+    if next_header == IPPROTO_UDP:
+        if len(payload) < UDP_HEADER:
+            return b""
+        sport, dport, length = struct.unpack(">HHH", payload[:6])
+        if length != len(payload):
+            return b""
+        if dport not in ports:
+            return icmpv6(dst, src, 1, 4, struct.pack(">I", 0) + quote)
+        data = payload[UDP_HEADER:]
+        udp = struct.pack(">HHHH", dport, sport, len(payload), 0) + data
+        check = pseudo_checksum(dst, src, IPPROTO_UDP, udp) or 0xFFFF
+        udp = udp[:6] + struct.pack(">H", check) + udp[8:]
+        return ipv6_packet(dst, src, IPPROTO_UDP, udp)
+    if next_header == IPPROTO_ICMPV6:
+        if len(payload) < 8 or payload[0] != 128:
+            return b""
+        return icmpv6(dst, src, 129, 0, payload[4:])
+    return icmpv6(dst, src, 4, 1, struct.pack(">I", 6) + quote)
+
+
+def serve(sock, layer, options, results):
+    """Simulated target process main loop"""
+    ports = set(options.get("PORTS", [7]))
+    rules = options.get("CRASH", [])
+    restart = options.get("CRASH_RESTART", 0)
+    frames = 0
+    replies = 0
+    dropped = 0
+    crashes = []
+    dead_until = 0
+    start = stop = perf_counter()
+    while True:
+        frame = sock.recv(65535)
+        if not frame:
+            break
+        now = perf_counter()
+        if not frames:
+            start = now
+        stop = now
+        frames += 1
+        if now < dead_until:
+            continue
+        if layer == 'raw2':
+            payload = frame[ETHER_HEADER:]
+        else:
+            payload = frame
+        if crashed(payload, rules):
+            crashes.append(frames)
+            dead_until = now + restart
+            continue
+        if layer == 'raw4':
+            reply = payload
+        else:
+            reply = respond_ipv6(payload, ports)
+            if reply and layer == 'raw2':
+                reply = frame[6:12] + frame[0:6] + frame[12:14] + reply
+        if reply:
+            try:
+                sock.send(reply, socket.MSG_DONTWAIT)
+                replies += 1
+            except BlockingIOError:
+                dropped += 1
+    elapsed = stop - start
+    sock.close()
+    results.send({
+        "FRAMES": frames,
+        "REPLIES": replies,
+        "DROPPED_REPLIES": dropped,
+        "CRASHES": crashes,
+        "ELAPSED": elapsed,
+        "RATE": frames / elapsed if elapsed else 0.0
+        })
+
+
+def report(stats):
+    """Print simulated target statistics"""
+    print("[+] Loopback target statistics:")
+    print("\t[-] Received {0} frames in {1:.2f} s ({2:.0f} frames/s)".format(
+        stats["FRAMES"], stats["ELAPSED"], stats["RATE"]))
+    print("\t[-] Sent {0} replies, dropped {1}".format(
+        stats["REPLIES"], stats["DROPPED_REPLIES"]))
+    if stats["CRASHES"]:
+        print("\t[-] Crashed {0} times, first at frame {1}".format(
+            len(stats["CRASHES"]), stats["CRASHES"][0]))
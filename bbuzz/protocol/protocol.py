@@ -8,8 +8,40 @@
 
 import bbuzz.common
 
+import select
 import socket
+import struct
 from binascii import unhexlify
+from collections import deque
+from time import perf_counter
+
+
+SOCK_TYPES = {
+        socket.IPPROTO_TCP: socket.SOCK_STREAM,
+        socket.IPPROTO_UDP: socket.SOCK_DGRAM
+        }
+
+# Linux socket option, not exported by the socket module
+IPV6_HDRINCL = 36
+
+# Patchable IP header fields as (bit offset, bit length)
+IPV4_FIELDS = {
+        "TOS": (8, 8),
+        "TOTAL_LENGTH": (16, 16),
+        "ID": (32, 16),
+        "FLAGS": (48, 3),
+        "FRAGMENT_OFFSET": (51, 13),
+        "TTL": (64, 8),
+        "PROTO": (72, 8),
+        "CHECKSUM": (80, 16)
+        }
+IPV6_FIELDS = {
+        "TRAFFIC_CLASS": (4, 8),
+        "FLOW_LABEL": (12, 20),
+        "PAYLOAD_LENGTH": (32, 16),
+        "NEXT_HEADER": (48, 8),
+        "HOP_LIMIT": (56, 8)
+        }
 
 
 class Protocol():
@@ -37,6 +69,22 @@ class Protocol():
                         "SOURCE_IP": "STR_IP_ADDRESS"
                         "DESTINATION_IP": "STR_IP_ADDRESS"
                         "IP_VERSION": INT_IP_VERSION
+                        "PROTO": INT_0xPROTO_NUMBER (default UDP=0x11)
+                        "TTL": INT_TTL_OR_HOP_LIMIT (default 64)
+                        "HEADER_FIELDS": ["STR_FIELD_NAME"] (optional)
+                        NOTE: The IP header is built once from these options
+                        and prepended to every test case, which forms the
+                        IP payload. Only the length fields (and the IPv4
+                        checksum) are patched per case. Fields named in
+                        HEADER_FIELDS are fuzzed too: their values are
+                        taken, in order, from the leading bits of each
+                        test case, which have to add up to whole bytes.
+                        IPv4: TOS, TOTAL_LENGTH, ID, FLAGS,
+                        FRAGMENT_OFFSET, TTL, PROTO, CHECKSUM
+                        IPv6: TRAFFIC_CLASS, FLOW_LABEL, PAYLOAD_LENGTH,
+                        NEXT_HEADER, HOP_LIMIT
+                        Linux always rewrites the IPv4 total length and
+                        checksum of outgoing packets.
 
                         For 'raw4' a dictionary of the follwoing values
                         ((DESTINATION_IP, DESTINATION_PORT), PROTO)
@@ -48,11 +96,17 @@ class Protocol():
                         "DESTINATION_PORT": INT_PORT_NUMBER
                         "SOURCE_PORT": INT_PORT_NUMBER
                         "BROADCAST": BOOL_TURE-FALSE
+                        "POOL_SIZE": INT_CONNECTION_COUNT (optional)
+                        NOTE: With POOL_SIZE set, that many connected sockets
+                        are kept warm and reused across test cases. Dead
+                        connections are detected and replaced on acquire.
 
         """
         self.layer = protocol_layer.lower()
         self.options = protocol_options
         self.sock = False
+        self.pool = None
+        self.last_sock = None
 
     def create(self, interface):
         """Establish a specific layer connection"""
@@ -69,57 +123,187 @@ class Protocol():
             if self.layer == 'raw3':
                 if self.options["IP_VERSION"] == 4:
                     INET = 2
+                    HDRINCL = (socket.IPPROTO_IP, socket.IP_HDRINCL)
                 elif self.options["IP_VERSION"] == 6:
                     INET = 10
+                    HDRINCL = (socket.IPPROTO_IPV6, IPV6_HDRINCL)
+                if not self.template():
+                    return False
                 self.sock = socket.socket(
                         INET,
-                        socket.SOCK_RAW
-                        )
-                self.sock.bind((interface, 0))
-                return self.sock
-
-            if self.layer == 'raw4':
-                ip_version = self.options["IP_VERSION"]
-                if ip_version == 4:
-                    INET = 2
-                elif ip_version == 6:
-                    INET = 10
-                PROTO = self.options["PROTO"]
-                self.sock = socket.socket(
-                        INET,
-                        PROTO
+                        socket.SOCK_RAW,
+                        socket.IPPROTO_RAW
                         )
+                self.sock.setsockopt(HDRINCL[0], HDRINCL[1], 1)
                 socket.SO_BINDTODEVICE = 25
                 self.sock.setsockopt(
                         socket.SOL_SOCKET,
                         socket.SO_BINDTODEVICE,
                         interface.encode()
                         )
-                # Configure BROADCAST interface
-                if self.options["BROADCAST"]:
-                    self.sock.setsockopt(
-                            socket.SOL_SOCKET,
-                            socket.SO_REUSEADDR,
-                            1
-                            )
-                    self.sock.setsockopt(
-                            socket.SOL_SOCKET,
-                            socket.SO_BROADCAST,
-                            1
+                return self.sock
+
+            if self.layer == 'raw4':
+                self.interface = interface
+                pool_size = self.options.get("POOL_SIZE", 0)
+                if pool_size:
+                    self.pool = deque(
+                            self.connect(interface) for _ in range(pool_size)
                             )
-                    return self.sock
+                    self.sock = self.pool[0]
                 else:
-                    self.sock.connect(
-                            (
-                                self.options["DESTINATION_IP"],
-                                self.options["DESTINATION_PORT"]
-                                )
-                            )
+                    self.sock = self.connect(interface)
                 return self.sock
 
         else:
             return self.sock
 
+    def template(self):
+        """Build the Layer-3 header template and index the header fields
+        patched for every test case. Returns False if HEADER_FIELDS are
+        unknown or do not add up to whole bytes."""
+        src_ip = bbuzz.common.ip2hex(self.options["SOURCE_IP"])
+        dst_ip = bbuzz.common.ip2hex(self.options["DESTINATION_IP"])
+        proto = self.options.get("PROTO", socket.IPPROTO_UDP)
+        ttl = self.options.get("TTL", 64)
+        if self.options["IP_VERSION"] == 4:
+            header = struct.pack(
+                    ">BBHHHBBH4s4s",
+                    0x45, 0, 0, 0, 0x4000, ttl, proto, 0, src_ip, dst_ip
+                    )
+            fields = IPV4_FIELDS
+            self.length_field = "TOTAL_LENGTH"
+        else:
+            header = struct.pack(
+                    ">IHBB16s16s", 6 << 28, 0, proto, ttl, src_ip, dst_ip
+                    )
+            fields = IPV6_FIELDS
+            self.length_field = "PAYLOAD_LENGTH"
+        self.header_length = len(header)
+        self.header = int.from_bytes(header, 'big')
+        header_bits = self.header_length * bbuzz.common.BYTE
+
+        self.patches = []
+        lead_bits = 0
+        for name in self.options.get("HEADER_FIELDS", []):
+            if name not in fields:
+                return bbuzz.common.error_handler(
+                        "Unknown IPv{0} header field {1}, use one of {2}"
+                        .format(self.options["IP_VERSION"], name,
+                                ", ".join(fields))
+                        )
+            offset, length = fields[name]
+            shift = header_bits - offset - length
+            field_mask = ((1 << length) - 1) << shift
+            self.patches.append((length, shift, field_mask))
+            lead_bits += length
+        if lead_bits % bbuzz.common.BYTE:
+            return bbuzz.common.error_handler(
+                    "HEADER_FIELDS have to add up to whole bytes"
+                    )
+        self.lead_bits = lead_bits
+        self.lead_bytes = lead_bits // bbuzz.common.BYTE
+        fuzzed = self.options.get("HEADER_FIELDS", [])
+        offset, length = fields[self.length_field]
+        if self.length_field in fuzzed:
+            self.length_shift = None
+        else:
+            self.length_shift = header_bits - offset - length
+        self.checksum = (
+                self.options["IP_VERSION"] == 4 and "CHECKSUM" not in fuzzed
+                )
+        self.address = (self.options["DESTINATION_IP"], 0)
+        return True
+
+    def fixup(self, data):
+        """Return the Layer-3 packet of a test case: the header template
+        with the fuzzed fields, length and checksum patched in"""
+        header = self.header
+        if self.patches:
+            lead = int.from_bytes(data[:self.lead_bytes], 'big')
+            data = data[self.lead_bytes:]
+            remaining = self.lead_bits
+            for length, shift, field_mask in self.patches:
+                remaining -= length
+                value = (lead >> remaining) & ((1 << length) - 1)
+                header = (header & ~field_mask) | (value << shift)
+        if self.length_shift is not None:
+            length = len(data)
+            if self.length_field == "TOTAL_LENGTH":
+                length += self.header_length
+            header |= (length & 0xFFFF) << self.length_shift
+        packet = header.to_bytes(self.header_length, 'big')
+        if self.checksum:
+            check = bbuzz.common.checksum(packet)
+            packet = packet[:10] + struct.pack(">H", check) + packet[12:]
+        return packet + data
+
+    def connect(self, interface):
+        """Open a single Layer-4 socket to the configured destination"""
+        ip_version = self.options["IP_VERSION"]
+        if ip_version == 4:
+            INET = 2
+        elif ip_version == 6:
+            INET = 10
+        PROTO = self.options["PROTO"]
+        sock = socket.socket(
+                INET,
+                SOCK_TYPES.get(PROTO, socket.SOCK_RAW),
+                PROTO
+                )
+        socket.SO_BINDTODEVICE = 25
+        sock.setsockopt(
+                socket.SOL_SOCKET,
+                socket.SO_BINDTODEVICE,
+                interface.encode()
+                )
+        # Configure BROADCAST interface
+        if self.options["BROADCAST"]:
+            sock.setsockopt(
+                    socket.SOL_SOCKET,
+                    socket.SO_REUSEADDR,
+                    1
+                    )
+            sock.setsockopt(
+                    socket.SOL_SOCKET,
+                    socket.SO_BROADCAST,
+                    1
+                    )
+        else:
+            sock.connect(
+                    (
+                        self.options["DESTINATION_IP"],
+                        self.options["DESTINATION_PORT"]
+                        )
+                    )
+        return sock
+
+    def alive(self, sock):
+        """Check without blocking whether a pooled socket is still usable"""
+        try:
+            return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) != b""
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+
+    def acquire(self):
+        """Take a warm connection from the pool, replacing it if dead"""
+        if self.pool is None:
+            return self.sock
+        if not self.pool:
+            return self.connect(self.interface)
+        sock = self.pool.popleft()
+        if not self.alive(sock):
+            sock.close()
+            sock = self.connect(self.interface)
+        return sock
+
+    def release(self, sock):
+        """Return a connection to the pool after use"""
+        if self.pool is not None:
+            self.pool.append(sock)
+
     def send(self, data):
         """Send data over established connection"""
         if self.layer == 'raw2':
@@ -129,7 +313,7 @@ class Protocol():
             self.sock.send(dst_mac + src_mac + ethertype + data)
 
         if self.layer == 'raw3':
-            self.sock.connect()
+            self.sock.sendto(self.fixup(data), self.address)
 
         if self.layer == 'raw4':
             if self.options["BROADCAST"]:
@@ -140,9 +324,70 @@ class Protocol():
                             self.options["DESTINATION_PORT"]
                             )
                         )
+            elif self.pool is not None:
+                self.send_sequence([data])
             else:
                 self.sock.send(data)
 
+    def send_batch(self, frames):
+        """Send several independent test cases back to back.
+        Stream connections take the whole batch in a single write."""
+        if (self.layer == 'raw4' and self.pool is None and
+                self.sock.type == socket.SOCK_STREAM):
+            self.sock.sendall(b"".join(frames))
+        elif self.layer == 'raw3':
+            sendto = self.sock.sendto
+            fixup = self.fixup
+            address = self.address
+            for frame in frames:
+                sendto(fixup(frame), address)
+        else:
+            for frame in frames:
+                self.send(frame)
+
+    def send_sequence(self, frames):
+        """Send a sequence of frames in order over a single connection"""
+        if self.pool is None:
+            for frame in frames:
+                self.send(frame)
+            return
+        sock = self.acquire()
+        try:
+            for frame in frames:
+                sock.send(frame)
+        except OSError:
+            # The target dropped the connection mid-session, keep the pool
+            # warm by replacing it instead of retrying the case
+            sock.close()
+            sock = self.connect(self.interface)
+        self.last_sock = sock
+        self.release(sock)
+
+    def receive(self, timeout=0.1, size=65535):
+        """Wait up to timeout seconds for a response to the last sent data.
+        Returns an empty bytes value if nothing was received."""
+        sock = self.last_sock if self.pool is not None else self.sock
+        if not sock:
+            return b""
+        remaining = timeout
+        while remaining >= 0:
+            start = perf_counter()
+            ready, _, _ = select.select([sock], [], [], remaining)
+            if not ready:
+                return b""
+            try:
+                data, address = sock.recvfrom(size)
+            except OSError:
+                return b""
+            # Packet sockets also capture the frames sent by ourselves
+            if self.layer != 'raw2' or address[2] != socket.PACKET_OUTGOING:
+                return data
+            remaining -= perf_counter() - start
+        return b""
+
     def kill(self):
         """Close an established connection socket"""
+        if self.pool is not None:
+            while self.pool:
+                self.pool.popleft().close()
         self.sock.close()
@@ -0,0 +1,80 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+import bbuzz.common
+import bbuzz.mutate
+
+
+class Session():
+    """Sequence several payloads into one stateful test case"""
+    def __init__(self):
+        """
+        A session describes the ordered messages delivered to the target
+        over a single connection for every test case, e.g. a handshake
+        followed by the fuzzed message.
+
+        Messages are added in order with add(). Static messages are
+        assembled once and sent verbatim for each case. Exactly one message
+        can be fuzzed by passing the Mutate instance generating it.
+        """
+        self.frames = []
+        self.mutant = None
+        self.fuzz_step = None
+
+    def add(self, payload, mutant=None):
+        """Append a message to the session.
+        If mutant is given, this message is replaced with the mutant output
+        for every test case, otherwise payload is sent as specified."""
+        if mutant is not None:
+            if self.mutant is not None:
+                return bbuzz.common.error_handler(
+                        "Session already has a fuzzed message at step {0}"
+                        .format(self.fuzz_step)
+                        )
+            self.mutant = mutant
+            self.fuzz_step = len(self.frames)
+            self.frames.append(None)
+        else:
+            static = bbuzz.mutate.Mutate(
+                    payload,
+                    {"STATIC": False, "RANDOM": False}
+                    )
+            self.frames.append(static.assemble_payload(static.bitfields))
+        return True
+
+    def step_count(self):
+        """Return the number of messages in the session"""
+        return len(self.frames)
+
+    @property
+    def options(self):
+        """Mutation options of the fuzzed message"""
+        return self.mutant.options if self.mutant is not None else {}
+
+    def feedback(self, response, elapsed):
+        """Pass the target response on to the fuzzed message mutant"""
+        return self.mutant.feedback(response, elapsed)
+
+    def reference(self):
+        """Return the message sequence with the fuzzed message unmutated"""
+        frames = list(self.frames)
+        frames[self.fuzz_step] = self.mutant.reference()
+        return frames
+
+    def get(self):
+        """Return the message sequence of the next test case.
+        Mutate control values (__END, __FIN) are passed through as is."""
+        if self.mutant is None:
+            bbuzz.common.error_handler("Session has no fuzzed message")
+            return False
+        mutation = self.mutant.get()
+        if not mutation or mutation in ("__END", "__FIN"):
+            return mutation
+        frames = list(self.frames)
+        frames[self.fuzz_step] = mutation
+        return frames
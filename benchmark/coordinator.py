@@ -0,0 +1,119 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+"""Multi-node campaign harness on localhost.
+
+Runs a Coordinator and several Worker threads, each fuzzing its own
+loopback target, over the indexed mutation space of the loopback
+benchmark payload. A straggler takes a lease and completes it only after
+it has been reclaimed, which must not be counted. Checks that every case
+is sent exactly once and every crash is reported once.
+
+Usage: python3 benchmark/coordinator.py [WORKERS]
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bbuzz
+from loopback import ipv6_payload, target
+
+
+OPTIONS = {"STATIC": True, "RANDOM": False, "DETERMINISTIC": True}
+CRASH = [{"OFFSET": 56, "LENGTH": 8, "VALUE": 0}]
+LEASE_TIMEOUT = 1.0
+
+
+def oracle(case, payload, response):
+    """Report test cases which crash the loopback target"""
+    if bbuzz.protocol.loopback.crashed(payload, CRASH):
+        return "hop limit 0"
+    return None
+
+
+def straggler(address):
+    """Lease a range and complete it after it has been reclaimed"""
+    with socket.create_connection(address) as connection:
+        stream = connection.makefile('rwb')
+
+        def request(message):
+            stream.write(json.dumps(message).encode() + b"\n")
+            stream.flush()
+            return json.loads(stream.readline())
+
+        request({"op": "hello", "worker": "straggler"})
+        lease = request({"op": "lease", "worker": "straggler"})
+        sleep(LEASE_TIMEOUT * 2)
+        late = request({
+            "op": "complete",
+            "lease": lease["lease"],
+            "counters": {"sent": lease["stop"] - lease["start"]},
+            "crashes": [{"case": lease["start"], "info": "late"}]
+            })
+        print("[+] Straggler completion accepted: {0}".format(late["ok"]))
+        return late["ok"]
+
+
+def main(workers=4):
+    mutant = bbuzz.mutate.Mutate(ipv6_payload(), dict(OPTIONS))
+    coordinator = bbuzz.fuzz.Coordinator(
+            mutant, lease_size=500, lease_timeout=LEASE_TIMEOUT
+            )
+    address = coordinator.start()
+    late = threading.Thread(target=straggler, args=(address,))
+    late.start()
+    sleep(0.1)
+
+    targets = [target() for _ in range(workers)]
+    for proto in targets:
+        proto.create()
+    threads = [
+            threading.Thread(target=bbuzz.fuzz.Worker(
+                address, bbuzz.mutate.Mutate(ipv6_payload(), dict(OPTIONS)),
+                proto, name="worker-{0}".format(number), oracle=oracle
+                ).run)
+            for number, proto in enumerate(targets)
+            ]
+    began = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    late.join()
+    elapsed = perf_counter() - began
+    coordinator.report()
+    stats = coordinator.stats()
+    coordinator.stop()
+    for proto in targets:
+        proto.kill()
+
+    expected = [
+            case for case in range(stats["TOTAL"])
+            if oracle(case, mutant.indexed_case(case), b"")
+            ]
+    crashes = sorted(crash["case"] for crash in stats["CRASHES"])
+    print("[+] {0} cases in {1:.2f} s".format(stats["TOTAL"], elapsed))
+    checks = {
+            "every case completed": stats["COMPLETED"] == stats["TOTAL"],
+            "every case sent once": stats["COUNTERS"]["sent"] == stats["TOTAL"],
+            "every crash reported once": crashes == expected,
+            "lease reclaimed": stats["RECLAIMS"] >= 1
+            }
+    for name, passed in checks.items():
+        print("\t[-] {0}: {1}".format(name, "ok" if passed else "FAILED"))
+    return 0 if all(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 4))
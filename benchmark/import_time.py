@@ -0,0 +1,80 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+"""Import-time regression benchmark.
+
+Spawns fresh interpreters, as a short-lived fuzzing worker would, and measures
+the cost of "import bbuzz" on top of a bare interpreter start. Fails if the
+bare import pulls in heavy modules or exceeds the time budget.
+
+Usage: python3 benchmark/import_time.py [RUNS] [BUDGET_MS]
+"""
+
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("socket", "hashlib", "ipaddress", "bbuzz.mutate")
+PROBE = (
+    "import sys; import bbuzz; "
+    "print(','.join(m for m in {0!r} if m in sys.modules))"
+    ).format(HEAVY_MODULES)
+
+
+def spawn(code):
+    """Run code in a fresh interpreter and return (seconds, stdout)"""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = perf_counter()
+    result = subprocess.run(
+            [sys.executable, "-S", "-c", code],
+            env=env,
+            stdout=subprocess.PIPE,
+            check=True
+            )
+    return perf_counter() - start, result.stdout.decode().strip()
+
+
+def best_of(code, runs):
+    """Return the fastest of several interpreter runs"""
+    return min(spawn(code)[0] for _ in range(runs))
+
+
+def main(runs=20, budget_ms=15.0):
+    loaded = spawn(PROBE)[1]
+    baseline = best_of("pass", runs)
+    lazy = best_of("import bbuzz", runs)
+    full = best_of(
+            "import bbuzz; bbuzz.protocol; bbuzz.payload; "
+            "bbuzz.mutate; bbuzz.session; bbuzz.common; bbuzz.fuzz",
+            runs
+            )
+    cost_ms = (lazy - baseline) * 1000
+    print("[+] Interpreter start:\t{0:.2f} ms".format(baseline * 1000))
+    print("[+] import bbuzz:\t+{0:.2f} ms".format(cost_ms))
+    print("[+] All subpackages:\t+{0:.2f} ms".format(
+        (full - baseline) * 1000))
+
+    failed = False
+    if loaded:
+        print("[-] Heavy modules imported eagerly: {0}".format(loaded))
+        failed = True
+    if cost_ms > budget_ms:
+        print("[-] Import cost exceeds budget of {0} ms".format(budget_ms))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sys.exit(main(
+        int(args[0]) if len(args) > 0 else 20,
+        float(args[1]) if len(args) > 1 else 15.0
+        ))
@@ -0,0 +1,79 @@
+#!/usr/bin/python3 -tt
+# coding=utf-8
+#
+# This file is part of Bbuzz
+#
+# Licensed under the MIT license (MIT)
+# Please see LICENSE file for more details
+
+"""End-to-end throughput benchmark against the loopback target.
+
+Fuzzes the IPv6 header of example/example.py through the simulated target
+instead of tap0, once with the sequential driver and once with the
+generation/sending pipeline, and reports the target receive rates. A crash
+rule on the hop limit field exercises the crash reporting.
+
+Usage: python3 benchmark/loopback.py [CASES]
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bbuzz
+
+
+def ipv6_payload():
+    """Empty UDP datagram to the echo port, fuzzing the IPv6 traffic
+    class, hop limit and source address"""
+    load = bbuzz.payload.Payload()
+    load.add('6', {"FORMAT": "dec", "TYPE": "static", "LENGTH": 4})
+    load.add('0', {"FORMAT": "bin", "TYPE": "binary", "LENGTH": 8})
+    load.add('0', {"FORMAT": "bin", "TYPE": "binary", "LENGTH": 20,
+                   "FUZZABLE": False})
+    load.add('0008', {"FORMAT": "hex", "TYPE": "numeric", "LENGTH": 16,
+                      "FUZZABLE": False})
+    load.add('11', {"FORMAT": "hex", "TYPE": "numeric", "LENGTH": 8,
+                    "FUZZABLE": False})
+    load.add('ff', {"FORMAT": "hex", "TYPE": "binary", "LENGTH": 8})
+    load.add(bbuzz.common.ip2bin('fe80::10e9:d8ff:fe6a:e8f0'),
+             {"FORMAT": "bin", "TYPE": "binary", "LENGTH": 128})
+    load.add(bbuzz.common.ip2bin('fe80::5054:ff:fe12:3456'),
+             {"FORMAT": "bin", "TYPE": "binary", "LENGTH": 128,
+              "FUZZABLE": False})
+    load.add('03e8000700080000',                    # UDP to echo port
+             {"FORMAT": "hex", "TYPE": "static", "LENGTH": 64})
+    return load
+
+
+def target():
+    """Loopback target crashing on a zero hop limit"""
+    return bbuzz.protocol.Loopback('raw2', {
+        "ETHER_TYPE": "0x86DD",
+        "CRASH": [{"OFFSET": 56, "LENGTH": 8, "VALUE": 0}]
+        })
+
+
+def main(cases=100000):
+    options = {"STATIC": False, "RANDOM": True}
+
+    print("[+] Sequential driver:")
+    proto = target()
+    proto.create()
+    mutant = bbuzz.mutate.Mutate(ipv6_payload(), dict(options))
+    for _ in range(cases):
+        proto.send(mutant.get())
+        proto.receive(0)
+    proto.kill()
+
+    print("[+] Pipeline driver:")
+    proto = target()
+    proto.create()
+    mutant = bbuzz.mutate.Mutate(ipv6_payload(), dict(options))
+    bbuzz.fuzz.Fuzz(0).pipeline(mutant, proto, limit=cases)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))